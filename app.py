@@ -24,23 +24,105 @@ POSTGRES_URI = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24))
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', POSTGRES_URI)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+def env_flag(name: str, default: bool) -> bool:
+    """Read a true/false setting from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def build_engine_options(database_uri: str) -> dict:
+    """
+    SQLAlchemy engine options from the environment.
+    
+    Pool settings only apply to PostgreSQL. With DB_PGBOUNCER set, client-side
+    pooling is turned off (PgBouncer does the pooling) and no startup options
+    are sent, since PgBouncer rejects them; set statement_timeout on the
+    database role instead (ALTER ROLE ... SET statement_timeout = ...).
+    """
+    options = {
+        # Check connections on checkout so a Postgres restart doesn't surface as errors
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+    }
+    if not database_uri.startswith('postgresql'):
+        return options
+    
+    if env_flag('DB_PGBOUNCER', False):
+        from sqlalchemy.pool import NullPool
+        options['poolclass'] = NullPool
+        return options
+    
+    options.update({
+        # Sized for gthread workers: one connection per thread plus headroom
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    })
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    if statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# Statements slower than this are logged as warnings
+app.config['DB_SLOW_QUERY_MS'] = float(os.environ.get('DB_SLOW_QUERY_MS', 500))
 # Use a consistent JWT secret key across all workers and restarts
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-postcode-tracker-2024-consistent')
 app.config['JWT_EXPIRATION_DELTA'] = timedelta(days=30)
+# Background export jobs: where finished files are kept and for how long
+app.config['EXPORT_JOB_DIR'] = os.environ.get('EXPORT_JOB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+app.config['EXPORT_JOB_TTL'] = timedelta(hours=int(os.environ.get('EXPORT_JOB_TTL_HOURS', 24)))
+# Users allowed to call the ops (debug) endpoints, comma-separated
+app.config['OPS_USERNAMES'] = {name.strip() for name in os.environ.get('OPS_USERNAMES', '').split(',') if name.strip()}
+# When postcodes.io gives no postcode, reuse one from the user's journeys within this distance (0 = off)
+app.config['HISTORY_GEOCODE_MAX_MILES'] = float(os.environ.get('HISTORY_GEOCODE_MAX_MILES', 0.25))
+# Sorted postcode list for autocomplete, built with 'python postcode_index.py build'
+app.config['POSTCODE_INDEX_PATH'] = os.environ.get('POSTCODE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'postcodes.idx'))
+def stream_connection_limit(worker_class: str) -> int:
+    """
+    Active journey streams allowed per worker process.
+    
+    JOURNEY_STREAM_MAX_CONNECTIONS if set; otherwise many for gevent or
+    eventlet workers, where an open stream is a greenlet, and 2 for other
+    worker classes, where each one holds a thread.
+    """
+    configured = os.environ.get('JOURNEY_STREAM_MAX_CONNECTIONS')
+    if configured:
+        return int(configured)
+    return 500 if any(name in worker_class.lower() for name in ('gevent', 'eventlet')) else 2
+
+# Active journey streams: open streams per worker process (gunicorn.conf.py sets it again from
+# the worker class gunicorn actually uses), seconds between keepalives, and seconds before a stream is closed
+app.config['JOURNEY_STREAM_MAX_CONNECTIONS'] = stream_connection_limit(os.environ.get('GUNICORN_WORKER_CLASS', ''))
+app.config['JOURNEY_STREAM_HEARTBEAT'] = float(os.environ.get('JOURNEY_STREAM_HEARTBEAT', 25))
+app.config['JOURNEY_STREAM_MAX_SECONDS'] = float(os.environ.get('JOURNEY_STREAM_MAX_SECONDS', 3600))
+# On-demand request profiling: off unless a token is set; reports go to PROFILE_DIR
+app.config['PROFILER_TOKEN'] = os.environ.get('PROFILER_TOKEN')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
 
 # Initialize extensions
 from database import db
 db.init_app(app)
+from db_metrics import init_db_metrics
+init_db_metrics(app)
+from metrics import init_metrics
+init_metrics(app)
+from request_profiler import init_profiler
+init_profiler(app)
+from postcode_index import init_postcode_index
+init_postcode_index(app)
 CORS(app, origins=["*"])  # Allow all origins for development
 
 # Import models and routes after app initialization
-from models import Journey, User
+from models import Journey, User, ExportJob
 from routes import *
 
-# Create tables
+# Check the schema version (one query) instead of running create_all on every boot
+from schema import ensure_schema
 with app.app_context():
-    db.create_all()
-    logger.info("Database tables created successfully")
+    ensure_schema()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8005))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Excel export at 50k rows.
+
+Compares the previous in-memory workbook (cell-by-cell writes plus a second
+pass over sheet.columns for widths) against the write-only export in
+journey_export.write_excel. Reports wall time and peak Python memory.
+
+Usage:
+    python benchmarks/bench_excel_export.py [--rows 50000]
+
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_db_dir = tempfile.mkdtemp(prefix='bench_excel_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'bench.db')}")
+
+from app import app  # noqa: E402
+from database import db  # noqa: E402
+from models import Journey, User  # noqa: E402
+from journey_export import EXPORT_HEADERS, write_excel  # noqa: E402
+
+
+def seed(rows: int) -> int:
+    """Create a benchmark user with the given number of journeys."""
+    username = f'bench_excel_{rows}'
+    user = User.query.filter_by(username=username).first()
+    if user:
+        return user.id
+
+    user = User(username=username, password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+
+    base = datetime(2020, 1, 1)
+    batch = []
+    for i in range(rows):
+        start = base + timedelta(hours=i)
+        batch.append({
+            'user_id': user.id,
+            'start_postcode': f'AB{i % 60 + 1}1AA',
+            'end_postcode': f'AB{(i + 7) % 60 + 1}2BB',
+            'start_time': start,
+            'end_time': start + timedelta(minutes=35),
+            'distance_miles': round((i % 500) * 0.37, 2),
+            'client_name': f'Client {i % 40}',
+            'recharge_to_client': i % 3 == 0,
+            'description': f'Site visit number {i} for quarterly maintenance'
+        })
+        if len(batch) == 5000:
+            db.session.execute(db.insert(Journey), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Journey), batch)
+    db.session.commit()
+    return user.id
+
+
+def legacy_excel(user_id: int, target) -> None:
+    """The export as it was before write-only mode, kept for comparison."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill
+
+    journeys = Journey.query.filter_by(user_id=user_id).order_by(Journey.start_time.desc()).all()
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Journeys"
+    for col, header in enumerate(EXPORT_HEADERS, 1):
+        cell = sheet.cell(row=1, column=col, value=header)
+        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        cell.font = Font(color="FFFFFF", bold=True)
+    for row_idx, journey in enumerate(journeys, 2):
+        recharge_text = 'Yes' if journey.recharge_to_client else 'No' if journey.recharge_to_client is not None else ''
+        row_data = [
+            journey.start_time.strftime('%Y-%m-%d') if journey.start_time else '',
+            journey.start_postcode,
+            journey.end_postcode or '',
+            journey.client_name or '',
+            recharge_text,
+            journey.description or '',
+            float(journey.distance_miles) if journey.distance_miles else ''
+        ]
+        for col, value in enumerate(row_data, 1):
+            sheet.cell(row=row_idx, column=col, value=value)
+    for column in sheet.columns:
+        max_length = 0
+        for cell in column:
+            if len(str(cell.value)) > max_length:
+                max_length = len(str(cell.value))
+        sheet.column_dimensions[column[0].column_letter].width = min(max_length + 2, 50)
+    workbook.save(target)
+
+
+def measure(label: str, export, user_id: int) -> None:
+    # Time and memory are measured in separate runs; tracemalloc slows
+    # allocation-heavy code down far too much to time it at the same time
+    db.session.expunge_all()
+    with tempfile.TemporaryFile() as target:
+        started = time.perf_counter()
+        export(user_id, target)
+        elapsed = time.perf_counter() - started
+        size = target.tell()
+
+    db.session.expunge_all()
+    with tempfile.TemporaryFile() as target:
+        tracemalloc.start()
+        export(user_id, target)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:<12} {elapsed:8.2f} s {peak / 1024 / 1024:10.1f} MB peak {size / 1024:10.0f} KB file")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id = seed(args.rows)
+        print(f"Excel export, {args.rows} rows ({db.engine.url.get_backend_name()})")
+        measure('legacy', legacy_excel, user_id)
+        measure('write-only', write_excel, user_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the functions that run on every journey.
+
+Each case is timed with timeit (the median of several rounds, each the best
+of several repeats), expressed as a multiple of a fixed reference workload
+timed alongside it, and compared with the stored baseline in
+benchmarks/baselines.json. The script exits with
+status 1 if any case is more than --threshold slower than its baseline, so
+it can gate a deploy.
+
+postcodes.io calls use responses recorded in benchmarks/fixtures, served by
+a stub HTTP session, so the request/parse path is measured without network
+I/O. Calibrating against the reference workload makes baselines fairly
+portable, but they are best recorded on the machine that runs the
+comparison.
+
+Usage:
+    python benchmarks/bench_hot_paths.py                  # compare with baselines
+    python benchmarks/bench_hot_paths.py --save-baseline  # record new baselines
+    python benchmarks/bench_hot_paths.py --threshold 0.4 --only validate_postcode
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from models import Journey  # noqa: E402
+from postcode_service import PostcodeService  # noqa: E402
+
+FIXTURES = os.path.join(HERE, 'fixtures', 'postcodes_io_responses.json')
+BASELINES = os.path.join(HERE, 'baselines.json')
+
+SAMPLE_POSTCODES = ['AB10 1AA', 'ab101aa', 'SW1A 1AA', 'EC1A1BB', 'M1 1AE', 'B33 8TH', 'NOT A POSTCODE', '']
+
+
+class RecordedResponse:
+    """Stands in for requests.Response; JSON is decoded on every call, as the real one does."""
+
+    def __init__(self, body: str):
+        self.status_code = 200
+        self._body = body
+
+    def json(self):
+        return json.loads(self._body)
+
+
+class RecordedSession:
+    """Serves recorded postcodes.io responses by request shape."""
+
+    def __init__(self, fixtures: dict):
+        self.reverse = RecordedResponse(json.dumps(fixtures['reverse_geocode']))
+        self.lookup = RecordedResponse(json.dumps(fixtures['postcode_lookup']))
+        self.bulk = RecordedResponse(json.dumps(fixtures['bulk_lookup']))
+
+    def get(self, url, timeout=None):
+        return self.reverse if '?lon=' in url else self.lookup
+
+    def post(self, url, json=None, timeout=None):
+        return self.bulk
+
+
+def make_journeys(count: int):
+    started = datetime(2024, 5, 1, 8, 30)
+    return [
+        Journey(
+            id=index, start_postcode='AB101AA', end_postcode='AB155YL', start_time=started,
+            end_time=started + timedelta(minutes=35), distance_miles=12.5, user_id=1,
+            client_name='Client A', recharge_to_client=bool(index % 2), description='Site visit',
+            start_latitude=57.148239, start_longitude=-2.096648, end_latitude=57.136148, end_longitude=-2.163271,
+            resolution_status=None, trail_point_count=0,
+            start_postcode_approximate=False, end_postcode_approximate=False
+        )
+        for index in range(count)
+    ]
+
+
+def build_cases():
+    """Name -> zero-argument callable. Each callable is one unit of work."""
+    journeys = make_journeys(100)
+    bulk_postcodes = SAMPLE_POSTCODES * 125  # 1000 postcodes
+    bulk_lookup_postcodes = ['AB11 5QN', 'AB21 7DU', 'AB24 3FX', 'AB25 1XQ', 'ZZ99 9ZZ']
+    coordinate_pairs = [(57.148239, -2.096648, 51.0 + index / 50, -0.141588 - index / 40) for index in range(100)]
+
+    def validate_postcode():
+        for postcode in SAMPLE_POSTCODES:
+            PostcodeService.validate_postcode(postcode)
+
+    return {
+        'validate_postcode': validate_postcode,
+        'bulk_validate_postcodes_1000': lambda: PostcodeService.bulk_validate_postcodes(bulk_postcodes),
+        'calculate_distance_from_coordinates_100': lambda: [
+            PostcodeService.calculate_distance_from_coordinates(*pair) for pair in coordinate_pairs
+        ],
+        'journey_to_dict_100': lambda: [journey.to_dict() for journey in journeys],
+        'reverse_geocode_parse': lambda: PostcodeService.get_postcode_from_coordinates(57.148239, -2.096648),
+        'postcode_lookup_parse': lambda: PostcodeService.get_postcode_info('AB15 4YL'),
+        'bulk_lookup_parse': lambda: PostcodeService.bulk_get_postcode_info(bulk_lookup_postcodes),
+    }
+
+
+def reference_workload():
+    """Fixed pure-Python work used to calibrate for the speed of the machine."""
+    total = 0
+    for index in range(2000):
+        total += len(str(index * 7).upper().replace('1', ''))
+    return total
+
+
+def time_case(function, repeat: int) -> Tuple[float, float]:
+    """
+    Best time per call in microseconds, and the same as a multiple of the reference workload.
+
+    The case and the reference are timed alternately so both see the same
+    machine load.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    reference_timer = timeit.Timer(reference_workload)
+    reference_number, _ = reference_timer.autorange()
+    timer.timeit(number)  # Warm up caches before the timed repeats
+
+    best = best_reference = float('inf')
+    for _ in range(repeat):
+        best = min(best, timer.timeit(number) / number)
+        best_reference = min(best_reference, reference_timer.timeit(reference_number) / reference_number)
+    return best * 1e6, best / best_reference
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='PostcodeService hot path microbenchmarks')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baselines')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int, default=7, help='Timing repeats per case (best is kept)')
+    parser.add_argument('--rounds', type=int, default=3, help='Measurements per case (the median is used)')
+    parser.add_argument('--only', help='Comma-separated case names to run')
+    args = parser.parse_args()
+
+    # Keep per-call log lines out of the measurements
+    logging.disable(logging.CRITICAL)
+
+    with open(FIXTURES) as source:
+        session = RecordedSession(json.load(source))
+    PostcodeService._get_session = classmethod(lambda cls: session)
+
+    cases = build_cases()
+    if args.only:
+        names = [name.strip() for name in args.only.split(',')]
+        unknown = set(names) - set(cases)
+        if unknown:
+            parser.error(f"Unknown case(s): {', '.join(sorted(unknown))}")
+        cases = {name: cases[name] for name in names}
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as source:
+            baselines = json.load(source)
+
+    # Cases are compared as multiples of the reference workload, so a busier
+    # or slower machine doesn't read as a regression
+    results = {}
+    regressions = []
+    for name, function in cases.items():
+        # Median over rounds, so one lucky or unlucky round doesn't set the result
+        rounds = sorted((time_case(function, args.repeat) for _ in range(args.rounds)), key=lambda result: result[1])
+        elapsed, results[name] = rounds[len(rounds) // 2]
+        baseline = baselines.get(name)
+        if baseline:
+            change = results[name] / baseline - 1
+            flag = '  REGRESSION' if change > args.threshold else ''
+            if flag:
+                regressions.append(name)
+            print(f"{name:<38} {elapsed:10.2f} us   {results[name]:9.4f} x ref   "
+                  f"baseline {baseline:9.4f} x ref   {change:+7.1%}{flag}")
+        else:
+            print(f"{name:<38} {elapsed:10.2f} us   {results[name]:9.4f} x ref   (no baseline)")
+
+    if args.save_baseline:
+        baselines.update({name: round(value, 5) for name, value in results.items()})
+        with open(BASELINES, 'w') as target:
+            json.dump(baselines, target, indent=2, sort_keys=True)
+            target.write('\n')
+        print(f"Baselines written to {BASELINES}")
+        return
+
+    if regressions:
+        print(f"{len(regressions)} case(s) more than {args.threshold:.0%} slower than baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: app import time, which every gunicorn worker boot pays without preload.
+
+Imports the app in a fresh interpreter several times against a new database
+(schema created and versioned) and against an up-to-date one (a single
+version query), and reports whether the heavy optional modules were loaded.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5]
+
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'seconds': elapsed,
+    'openpyxl': 'openpyxl' in sys.modules,
+    'requests': 'requests' in sys.modules
+}))
+"""
+
+
+def import_app(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='App import time benchmark')
+    parser.add_argument('--runs', type=int, default=5, help='Imports per scenario')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='startup_'), 'startup.db')}")
+
+    first = import_app(env)
+    print(f"new database (create_all):     {first['seconds'] * 1000:7.0f} ms")
+
+    timings = []
+    for _ in range(args.runs):
+        result = import_app(env)
+        timings.append(result['seconds'])
+    print(f"up-to-date database (median):  {statistics.median(timings) * 1000:7.0f} ms over {args.runs} runs")
+    print(f"openpyxl loaded at startup: {result['openpyxl']}, requests loaded at startup: {result['requests']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for postcodes.io with configurable latency and error rate.
+
+Answers the three calls PostcodeService makes:
+    GET  /postcodes?lon=&lat=   reverse geocode
+    GET  /postcodes/<postcode>  postcode lookup
+    POST /postcodes             bulk postcode lookup
+
+Postcodes and coordinates are derived deterministically from the request,
+so distances are stable between runs. Point the app at it with
+POSTCODES_IO_URL / POSTCODES_IO_BACKUP_URL.
+
+Usage:
+    python benchmarks/fake_postcodes_io.py --port 8099 --latency 0.2 --error-rate 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Rough bounding box for mainland UK
+UK_LAT = (50.0, 58.5)
+UK_LON = (-5.5, 1.5)
+
+
+def postcode_for(latitude: float, longitude: float) -> str:
+    """A stable, validly formatted postcode for a coordinate (about 1km grid)."""
+    cell = zlib.crc32(f'{round(latitude, 2)}:{round(longitude, 2)}'.encode())
+    letters = 'ABDEFGHJLNPQRSTUWXYZ'
+    return (f"{letters[cell % 20]}{letters[(cell // 20) % 20]}{cell % 90 + 10} "
+            f"{(cell // 400) % 10}{letters[(cell // 4000) % 20]}{letters[(cell // 80000) % 20]}")
+
+
+def coordinates_for(postcode: str):
+    """Stable coordinates inside the UK for a postcode."""
+    cell = zlib.crc32(postcode.replace(' ', '').upper().encode())
+    latitude = UK_LAT[0] + (cell % 10000) / 10000 * (UK_LAT[1] - UK_LAT[0])
+    longitude = UK_LON[0] + ((cell // 10000) % 10000) / 10000 * (UK_LON[1] - UK_LON[0])
+    return round(latitude, 6), round(longitude, 6)
+
+
+def postcode_result(postcode: str) -> dict:
+    latitude, longitude = coordinates_for(postcode)
+    return {
+        'postcode': postcode,
+        'latitude': latitude,
+        'longitude': longitude,
+        'region': 'Scotland',
+        'admin_district': 'Aberdeen City'
+    }
+
+
+class FakePostcodesHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _simulate_upstream(self) -> bool:
+        """Sleep for the configured latency; return False to simulate a failure."""
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self._respond(500, {'status': 500, 'error': 'Simulated upstream error'})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._simulate_upstream():
+            return
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        if path.endswith('/postcodes'):
+            query = parse_qs(url.query)
+            try:
+                latitude = float(query['lat'][0])
+                longitude = float(query['lon'][0])
+            except (KeyError, ValueError):
+                return self._respond(400, {'status': 400, 'error': 'Invalid coordinates'})
+            if not (UK_LAT[0] <= latitude <= UK_LAT[1] and UK_LON[0] <= longitude <= UK_LON[1]):
+                return self._respond(200, {'status': 200, 'result': None})
+            return self._respond(200, {'status': 200, 'result': [postcode_result(postcode_for(latitude, longitude))]})
+        if '/postcodes/' in path:
+            postcode = path.rsplit('/', 1)[1].upper()
+            return self._respond(200, {'status': 200, 'result': postcode_result(postcode)})
+        self._respond(404, {'status': 404, 'error': 'Resource not found'})
+
+    def do_POST(self):
+        if not self._simulate_upstream():
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            postcodes = json.loads(self.rfile.read(length) or b'{}').get('postcodes', [])
+        except json.JSONDecodeError:
+            return self._respond(400, {'status': 400, 'error': 'Invalid JSON'})
+        self._respond(200, {
+            'status': 200,
+            'result': [{'query': postcode, 'result': postcode_result(postcode)} for postcode in postcodes]
+        })
+
+
+def start_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread and return it (server.server_port has the port)."""
+    handler = type('Handler', (FakePostcodesHandler,), {'latency': latency, 'error_rate': error_rate})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local postcodes.io stand-in')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.error_rate)
+    print(f"Fake postcodes.io on http://127.0.0.1:{server.server_port} "
+          f"(latency {args.latency}s, error rate {args.error_rate})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
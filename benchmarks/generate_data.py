@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Synthetic data for scale testing the journeys schema.
+
+Seeds N users and M journeys with realistic shapes:
+- journeys per user follow a Zipf-like distribution (a few heavy users,
+  a long tail of occasional ones)
+- journeys cluster around UK towns, with postcodes from each town's area
+- a mix of GPS journeys (with coordinates) and manual ones (postcodes only)
+- start times over the last two years, mostly on weekdays in working hours
+- one active journey for a small share of users
+
+Rows are built from the Journey and User table definitions, so the
+generator follows the models. On PostgreSQL journeys are streamed in with
+COPY from one worker process per CPU (10M rows take a few minutes); other
+databases get batched multi-row INSERTs from a single process.
+
+Usage:
+    python benchmarks/generate_data.py --users 10000 --journeys 10000000 [--seed 42]
+
+Uses DATABASE_URL like the app. Generated usernames start with 'seed_'
+and all share the password 'password'.
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+from app import app  # noqa: E402
+from database import db  # noqa: E402
+from models import Journey, User  # noqa: E402
+from postcode_service import PostcodeService  # noqa: E402
+from spatial import encode_geohash  # noqa: E402
+
+# Town centres and their postcode areas: (name, latitude, longitude, area, share of journeys)
+TOWNS = [
+    ('Aberdeen', 57.1497, -2.0943, 'AB', 0.18),
+    ('Edinburgh', 55.9533, -3.1883, 'EH', 0.12),
+    ('Glasgow', 55.8642, -4.2518, 'G', 0.12),
+    ('Dundee', 56.4620, -2.9707, 'DD', 0.06),
+    ('Inverness', 57.4778, -4.2247, 'IV', 0.04),
+    ('Newcastle', 54.9783, -1.6178, 'NE', 0.06),
+    ('Leeds', 53.8008, -1.5491, 'LS', 0.07),
+    ('Manchester', 53.4808, -2.2426, 'M', 0.09),
+    ('Birmingham', 52.4862, -1.8904, 'B', 0.08),
+    ('Bristol', 51.4545, -2.5879, 'BS', 0.05),
+    ('Cardiff', 51.4816, -3.1791, 'CF', 0.04),
+    ('London', 51.5072, -0.1276, 'SW', 0.09),
+]
+TOWN_WEIGHTS = list(accumulate(town[4] for town in TOWNS))
+
+CLIENTS = ['Acme Ltd', 'North Sea Services', 'Granite City Estates', 'Harbour Logistics', 'Deeside Care',
+           'Highland Energy', 'Civic Council', 'Thistle Holdings', 'Oakwood Surveys', 'Riverside Clinic']
+DESCRIPTIONS = ['Site visit', 'Client meeting', 'Inspection', 'Delivery', 'Training', 'Survey',
+                'Maintenance call', 'Quarterly review']
+INWARD_LETTERS = 'ABDEFGHJLNPQRSTUWXYZ'
+
+# Share of journeys entered manually (postcodes, no coordinates)
+MANUAL_SHARE = 0.3
+
+# Share of users with a journey in progress
+ACTIVE_USER_SHARE = 0.02
+
+# Zipf exponent for journeys per user
+USER_SKEW = 1.1
+
+# Journeys start within this many days before now
+HISTORY_DAYS = 730
+
+# Roads are longer than straight lines
+ROAD_FACTOR = 1.25
+
+BATCH_SIZE = 10000
+
+
+def random_postcode(rng: random.Random, area: str) -> str:
+    draw = rng.random
+    return (f"{area}{int(draw() * 39) + 1}{int(draw() * 10)}"
+            f"{INWARD_LETTERS[int(draw() * 20)]}{INWARD_LETTERS[int(draw() * 20)]}")
+
+
+def random_point(rng: random.Random, town):
+    _, latitude, longitude, _, _ = town
+    # Most trips stay near town, some go further afield
+    spread = 0.04 if rng.random() < 0.8 else 0.3
+    return round(rng.gauss(latitude, spread), 6), round(rng.gauss(longitude, spread * 1.6), 6)
+
+
+def random_start_time(rng: random.Random, now: datetime) -> datetime:
+    day = now - timedelta(days=rng.randrange(1, HISTORY_DAYS + 1))
+    while day.weekday() >= 5 and rng.random() < 0.85:
+        day -= timedelta(days=1)
+    hour = min(max(int(rng.gauss(12, 2.5)), 6), 20)
+    return day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+
+
+def journey_row(rng: random.Random, user_id: int, now: datetime, active: bool = False) -> dict:
+    town = TOWNS[bisect.bisect(TOWN_WEIGHTS, rng.random() * TOWN_WEIGHTS[-1])]
+    area = town[3]
+    manual = not active and rng.random() < MANUAL_SHARE
+    start_latitude, start_longitude = random_point(rng, town)
+    end_latitude, end_longitude = random_point(rng, town)
+    start_time = now - timedelta(minutes=rng.randint(5, 90)) if active else random_start_time(rng, now)
+
+    distance = PostcodeService.calculate_distance_from_coordinates(
+        start_latitude, start_longitude, end_latitude, end_longitude
+    )
+    return {
+        'start_postcode': random_postcode(rng, area),
+        'end_postcode': None if active else random_postcode(rng, area),
+        'start_time': start_time,
+        'end_time': None if active else start_time + timedelta(minutes=max(5, int(distance * 2.2 + rng.gauss(10, 5)))),
+        'distance_miles': None if active else round(distance * ROAD_FACTOR, 2),
+        'user_id': user_id,
+        'client_name': rng.choice(CLIENTS),
+        'recharge_to_client': rng.random() < 0.4,
+        'description': rng.choice(DESCRIPTIONS),
+        'start_latitude': None if manual else start_latitude,
+        'start_longitude': None if manual else start_longitude,
+        'end_latitude': None if manual or active else end_latitude,
+        'end_longitude': None if manual or active else end_longitude,
+        'resolution_status': None,
+        'resolution_attempts': 0,
+        'next_resolution_at': None,
+        'trail_point_count': 0,
+        'start_geohash': None if manual else encode_geohash(start_latitude, start_longitude),
+        'end_geohash': None if manual or active else encode_geohash(end_latitude, end_longitude),
+    }
+
+
+def journey_columns():
+    """Journey columns to fill, taken from the model so new columns are noticed; nullable ones left out stay NULL."""
+    columns = [column.name for column in Journey.__table__.columns if column.name != 'id']
+    sample = journey_row(random.Random(0), 1, datetime.utcnow())
+    missing = [name for name in columns if name not in sample and not Journey.__table__.columns[name].nullable]
+    if missing:
+        raise RuntimeError(f"generate_data.py does not fill required journey column(s): {', '.join(missing)}")
+    return [name for name in columns if name in sample]
+
+
+def create_users(count: int, rng: random.Random):
+    password_hash = generate_password_hash('password')  # Hashed once; every seed user shares it
+    run = f'{rng.randrange(16 ** 6):06x}'
+    user_ids = []
+    for start in range(0, count, BATCH_SIZE):
+        rows = [
+            {'username': f'seed_{run}_{index:07d}', 'password_hash': password_hash, 'created_at': datetime.utcnow()}
+            for index in range(start, min(start + BATCH_SIZE, count))
+        ]
+        user_ids.extend(db.session.execute(db.insert(User).returning(User.id), rows).scalars())
+    db.session.commit()
+    return user_ids
+
+
+def iter_journeys(rng: random.Random, user_ids, count: int, with_active: bool = True):
+    """Journey rows: a Zipf-like share per user, plus (with_active) one active journey for some users."""
+    now = datetime.utcnow()
+    cumulative = []
+    total = 0.0
+    for rank in range(1, len(user_ids) + 1):
+        total += 1 / rank ** USER_SKEW
+        cumulative.append(total)
+    order = user_ids[:]
+    rng.shuffle(order)  # So heavy users aren't simply the lowest ids
+
+    active_users = rng.sample(user_ids, min(int(len(user_ids) * ACTIVE_USER_SHARE), count)) if with_active else []
+    for user_id in active_users:
+        yield journey_row(rng, user_id, now, active=True)
+    for _ in range(count - len(active_users)):
+        user_id = order[bisect.bisect(cumulative, rng.random() * total)]
+        yield journey_row(rng, user_id, now)
+
+
+class _CopyStream(io.TextIOBase):
+    """File-like CSV stream of generated rows for COPY ... FROM STDIN."""
+
+    def __init__(self, rows, columns, progress):
+        self.rows = rows
+        self.columns = columns
+        self.progress = progress
+        self.buffer = ''
+        self.written = 0
+        self.line = io.StringIO()
+        self.writer = csv.writer(self.line)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            for row in self.rows:
+                self.writer.writerow([row[name] for name in self.columns])
+                self.written += 1
+                if self.written % BATCH_SIZE == 0:
+                    break
+            else:
+                self.rows = iter(())
+            chunk = self.line.getvalue()
+            self.line.seek(0)
+            self.line.truncate()
+            if not chunk:
+                break
+            self.buffer += chunk
+            self.progress(self.written)
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def load_with_copy(rows, columns, progress) -> bool:
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if not hasattr(cursor, 'copy_expert'):
+            return False
+        cursor.copy_expert(
+            f"COPY journeys ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            _CopyStream(rows, columns, progress)
+        )
+        connection.commit()
+        return True
+    finally:
+        connection.close()
+
+
+def load_with_inserts(rows, columns, progress) -> None:
+    batch = []
+    written = 0
+    for row in rows:
+        batch.append({name: row[name] for name in columns})
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(db.insert(Journey), batch)
+            db.session.commit()
+            written += len(batch)
+            batch = []
+            progress(written)
+    if batch:
+        db.session.execute(db.insert(Journey), batch)
+        db.session.commit()
+        progress(written + len(batch))
+
+
+def load_shard(shard: int, seed, user_ids, count: int, columns) -> str:
+    """Generate and load one worker's share of the journeys, returning the load method used."""
+    rng = random.Random(None if seed is None else seed * 1000 + shard)
+    rows = iter_journeys(rng, user_ids, count, with_active=shard == 0)
+    reported = 0
+
+    def progress(written: int) -> None:
+        nonlocal reported
+        with _progress.get_lock():
+            _progress.value += written - reported
+        reported = written
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # Don't share the parent's pooled connections
+        if db.engine.dialect.name == 'postgresql' and load_with_copy(rows, columns, progress):
+            return 'COPY'
+        load_with_inserts(rows, columns, progress)
+        return 'batched INSERT'
+
+
+# Journeys loaded so far across all workers (inherited by forked workers)
+_progress = multiprocessing.get_context('fork').Value('q', 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Seed synthetic users and journeys')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--journeys', type=int, default=100000)
+    parser.add_argument('--workers', type=int,
+                        help='Parallel loader processes (default: one per CPU on PostgreSQL, 1 otherwise)')
+    parser.add_argument('--seed', type=int, help='Random seed, for repeatable data')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+
+    def report() -> None:
+        elapsed = time.perf_counter() - started
+        print(f"  {_progress.value:>11,} journeys  {elapsed:7.1f}s  {_progress.value / max(elapsed, 1e-9):9,.0f} rows/s")
+
+    with app.app_context():
+        columns = journey_columns()
+        user_ids = create_users(args.users, rng)
+        is_postgres = db.engine.dialect.name == 'postgresql'
+    print(f"Created {len(user_ids):,} users in {time.perf_counter() - started:.1f}s")
+
+    workers = args.workers or ((os.cpu_count() or 1) if is_postgres else 1)
+    workers = max(1, min(workers, args.journeys // BATCH_SIZE or 1))
+    shares = [args.journeys // workers + (1 if shard < args.journeys % workers else 0) for shard in range(workers)]
+    jobs = [(shard, args.seed, user_ids, share, columns) for shard, share in enumerate(shares)]
+
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        result = pool.starmap_async(load_shard, jobs)
+        while not result.ready():
+            result.wait(5)
+            report()
+        methods = set(result.get())
+
+    if is_postgres:
+        # begin() commits on exit; a plain connect() would roll the statistics back on close
+        with app.app_context(), db.engine.begin() as connection:
+            connection.execute(db.text("ANALYZE journeys"))
+
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {args.users:,} users and {args.journeys:,} journeys with {', '.join(sorted(methods))} "
+          f"using {workers} worker(s) in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
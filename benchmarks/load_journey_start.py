@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent /journey/start requests against a slow geocoder.
+
+Starts the fake postcodes.io server with a fixed latency, then runs the real
+app under gunicorn once per worker configuration (sync and gthread by
+default) and fires journey starts at increasing concurrency, each from its
+own user. Reports throughput and latency percentiles per level.
+
+Usage:
+    python benchmarks/load_journey_start.py [--latency 0.2] [--requests 96]
+
+Uses DATABASE_URL if set, otherwise a throwaway SQLite database per run.
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_postcodes_io import start_server  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+API = '/LocationApp/api'
+
+CONFIGS = [
+    ('sync', {'GUNICORN_WORKER_CLASS': 'sync', 'WEB_CONCURRENCY': '4', 'GUNICORN_THREADS': '1'}),
+    ('gthread', {'GUNICORN_WORKER_CLASS': 'gthread', 'WEB_CONCURRENCY': '4', 'GUNICORN_THREADS': '8'}),
+]
+
+
+def start_app(port: int, geocoder_url: str, extra_env: dict) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='load_'), 'load.db')}")
+    env.update(extra_env)
+    env.update({'POSTCODES_IO_URL': geocoder_url, 'POSTCODES_IO_BACKUP_URL': geocoder_url})
+    process = subprocess.Popen(
+        ['gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--pid', os.path.join(tempfile.gettempdir(), f'load_{port}.pid'),
+         '--log-level', 'warning', '--access-logfile', '/dev/null', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{port}{API}'
+    for _ in range(100):
+        try:
+            if requests.get(f'{base}/health', timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('App did not start')
+
+
+def register(base: str) -> str:
+    response = requests.post(f'{base}/auth/register', json={
+        'username': f'load_{uuid.uuid4().hex[:12]}', 'password': 'loadtest'
+    }, timeout=60)
+    response.raise_for_status()
+    return response.json()['token']
+
+
+def start_journey(base: str, token: str) -> float:
+    started = time.perf_counter()
+    response = requests.post(f'{base}/journey/start', json={
+        'latitude': 57.15, 'longitude': -2.1, 'client_name': 'Load', 'description': 'Load test'
+    }, headers={'Authorization': f'Bearer {token}'}, timeout=60)
+    elapsed = time.perf_counter() - started
+    if response.status_code != 201:
+        raise RuntimeError(f'HTTP {response.status_code}: {response.text[:200]}')
+    return elapsed
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_level(base: str, concurrency: int, total: int) -> None:
+    # Registration (password hashing) is setup, not what is being measured
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        tokens = list(pool.map(lambda _: register(base), range(total)))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(lambda token: start_journey(base, token), tokens))
+        wall = time.perf_counter() - started
+    print(f"  concurrency {concurrency:>3}: {total / wall:7.1f} starts/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.0f} ms   p95 {percentile(latencies, 0.95) * 1000:7.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Concurrent journey start load test')
+    parser.add_argument('--latency', type=float, default=0.2, help='Geocoder latency in seconds')
+    parser.add_argument('--requests', type=int, default=96, help='Journey starts per concurrency level')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--port', type=int, default=8011)
+    args = parser.parse_args()
+
+    geocoder = start_server(latency=args.latency)
+    geocoder_url = f'http://127.0.0.1:{geocoder.server_port}'
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f"Journey starts with a {args.latency * 1000:.0f} ms geocoder, {args.requests} per level")
+    for name, env in CONFIGS:
+        print(f"{name} ({', '.join(f'{key}={value}' for key, value in env.items())})")
+        process = start_app(args.port, geocoder_url, env)
+        try:
+            for concurrency in levels:
+                run_level(f'http://127.0.0.1:{args.port}{API}', concurrency, args.requests)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+    geocoder.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Load test: scripted API scenarios with latency percentiles and throughput.
+
+Starts the fake postcodes.io server and the real app under gunicorn (or
+targets an already running app with --url), then runs each scenario for a
+fixed time with a number of concurrent virtual users, each logged in as its
+own user. Reports requests per second and p50/p95/p99 latency per
+operation, and optionally writes the results as JSON so runs before and
+after a change can be compared.
+
+Scenarios:
+    register   POST /auth/register with a new user each time
+    login      POST /auth/login
+    journey    POST /journey/start then /journey/end
+    manual     POST /journey/manual
+    list       GET /journeys (users are seeded with --seed-journeys first)
+    export     GET /journeys/export/csv and /journeys/export/excel
+
+Usage:
+    python benchmarks/load_scenarios.py [--scenarios login,journey,list]
+        [--concurrency 8] [--duration 10] [--latency 0.05] [--error-rate 0]
+        [--seed-journeys 200] [--json results.json]
+
+Uses DATABASE_URL if set (e.g. a local Postgres), otherwise a throwaway
+SQLite database.
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_postcodes_io import start_server  # noqa: E402
+from load_journey_start import API, percentile, start_app  # noqa: E402
+
+PASSWORD = 'loadtest'
+POSTCODES = ['AB10 1AA', 'AB11 5QN', 'AB15 4YL', 'AB21 7DU', 'AB24 3FX', 'AB25 1XQ']
+SCENARIOS = ['register', 'login', 'journey', 'manual', 'list', 'export']
+
+
+class VirtualUser:
+    """One simulated client with its own HTTP session and account."""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.http = requests.Session()
+        self.username = f'load_{uuid.uuid4().hex[:12]}'
+        self.token = None
+
+    def request(self, results, operation: str, method: str, path: str, expected=(200,), **kwargs):
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, f'{self.base}{path}', headers=headers, timeout=120, **kwargs)
+            response.content  # Include the body (e.g. streamed exports) in the timing
+            ok = response.status_code in expected
+        except requests.RequestException:
+            response, ok = None, False
+        results.record(operation, time.perf_counter() - started, ok)
+        return response
+
+    def register(self, results=None):
+        response = self.request(results or NullResults(), 'register', 'POST', '/auth/register',
+                                expected=(201,), json={'username': self.username, 'password': PASSWORD})
+        if response is not None and response.status_code == 201:
+            self.token = response.json()['token']
+
+
+class Results:
+    """Thread-safe latency and error collection per operation."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, operation: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies[operation].append(seconds)
+            if not ok:
+                self.errors[operation] += 1
+
+    def summary(self, wall: float) -> dict:
+        return {
+            operation: {
+                'requests': len(values),
+                'errors': self.errors[operation],
+                'throughput': len(values) / wall,
+                'p50_ms': statistics.median(values) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': max(values) * 1000
+            }
+            for operation, values in sorted(self.latencies.items())
+        }
+
+
+class NullResults:
+    def record(self, operation, seconds, ok):
+        pass
+
+
+def manual_journey_body() -> dict:
+    start, end = random.sample(POSTCODES, 2)
+    return {
+        'start_postcode': start, 'end_postcode': end, 'client_name': 'Load',
+        'recharge_to_client': random.random() < 0.5, 'description': 'Load test'
+    }
+
+
+def run_scenario(user: VirtualUser, scenario: str, results: Results) -> None:
+    """One iteration of a scenario."""
+    if scenario == 'register':
+        VirtualUser(user.base).register(results)
+    elif scenario == 'login':
+        user.request(results, 'login', 'POST', '/auth/login',
+                     json={'username': user.username, 'password': PASSWORD})
+    elif scenario == 'journey':
+        position = {'latitude': 57.1 + random.random() / 10, 'longitude': -2.1 - random.random() / 10}
+        user.request(results, 'journey_start', 'POST', '/journey/start', expected=(201,),
+                     json={**position, 'client_name': 'Load', 'description': 'Load test'})
+        position['latitude'] += 0.05
+        user.request(results, 'journey_end', 'POST', '/journey/end', json=position)
+    elif scenario == 'manual':
+        user.request(results, 'manual', 'POST', '/journey/manual', expected=(201,), json=manual_journey_body())
+    elif scenario == 'list':
+        user.request(results, 'list', 'GET', '/journeys')
+    elif scenario == 'export':
+        user.request(results, 'export_csv', 'GET', '/journeys/export/csv')
+        user.request(results, 'export_excel', 'GET', '/journeys/export/excel')
+    else:
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def seed_journeys(user: VirtualUser, count: int) -> None:
+    """Give a user count completed journeys through the bulk import."""
+    today = date.today()
+    rows = []
+    for index in range(count):
+        start, end = random.sample(POSTCODES, 2)
+        rows.append({
+            'Date': (today - timedelta(days=index % 365)).isoformat(),
+            'Postcode From': start, 'Postcode To': end, 'Client Name': f'Client {index % 7}',
+            'Recharge to Client': 'Yes' if index % 2 else 'No', 'Description': 'Seeded', 'Total Miles': '12.5'
+        })
+    user.request(NullResults(), 'seed', 'POST', '/journeys/import', expected=(200, 201), json={'journeys': rows})
+
+
+def run(base: str, scenario: str, users, duration: float) -> dict:
+    results = Results()
+    deadline = time.perf_counter() + duration
+
+    def loop(user):
+        while time.perf_counter() < deadline:
+            run_scenario(user, scenario, results)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(users)) as pool:
+        list(pool.map(loop, users))
+    return results.summary(time.perf_counter() - started)
+
+
+def print_summary(scenario: str, summary: dict) -> None:
+    print(f"{scenario}")
+    for operation, stats in summary.items():
+        print(f"  {operation:<14} {stats['requests']:>6} req  {stats['errors']:>4} err  "
+              f"{stats['throughput']:7.1f} req/s   p50 {stats['p50_ms']:7.1f} ms   "
+              f"p95 {stats['p95_ms']:7.1f} ms   p99 {stats['p99_ms']:7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Scripted API load test')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run each scenario')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake geocoder latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fake geocoder error rate')
+    parser.add_argument('--seed-journeys', type=int, default=200, help='Journeys imported per user before running')
+    parser.add_argument('--url', help='Base URL of a running app (e.g. http://127.0.0.1:8005); '
+                                      'its geocoder is not replaced')
+    parser.add_argument('--port', type=int, default=8012)
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    geocoder = process = None
+    if args.url:
+        base = f'{args.url.rstrip("/")}{API}'
+    else:
+        geocoder = start_server(latency=args.latency, error_rate=args.error_rate)
+        geocoder_url = f'http://127.0.0.1:{geocoder.server_port}'
+        process = start_app(args.port, geocoder_url, {})
+        base = f'http://127.0.0.1:{args.port}{API}'
+
+    try:
+        users = [VirtualUser(base) for _ in range(args.concurrency)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(VirtualUser.register, users))
+        if not all(user.token for user in users):
+            raise RuntimeError('Could not register the virtual users')
+        if args.seed_journeys and {'list', 'export'} & set(scenarios):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda user: seed_journeys(user, args.seed_journeys), users))
+
+        print(f"{args.concurrency} users, {args.duration:.0f}s per scenario"
+              + ('' if args.url else f", geocoder latency {args.latency * 1000:.0f} ms, error rate {args.error_rate}"))
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = run(base, scenario, users, args.duration)
+            print_summary(scenario, results[scenario])
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+        if geocoder is not None:
+            geocoder.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as target:
+            json.dump({'settings': vars(args), 'results': results}, target, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import logging
+import time
+from flask import g, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed_ms = (time.perf_counter() - start_times.pop()) * 1000
+
+    if not has_app_context():
+        return
+
+    g.db_query_count = g.get('db_query_count', 0) + 1
+    g.db_time_ms = g.get('db_time_ms', 0.0) + elapsed_ms
+
+    if elapsed_ms >= current_app.config['DB_SLOW_QUERY_MS']:
+        logger.warning(f"Slow query ({elapsed_ms:.0f} ms): {' '.join(statement.split())[:500]}")
+
+
+def get_db_stats():
+    """Query count and total DB time (ms) recorded so far in this app context."""
+    return g.get('db_query_count', 0), g.get('db_time_ms', 0.0)
+
+
+def init_db_metrics(app):
+    """
+    Record query count and DB time per request.
+
+    Timings come from SQLAlchemy cursor events on every engine. Each response
+    gets a Server-Timing header (visible in browser dev tools and proxies)
+    and the totals are logged at debug level.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.after_request
+    def add_db_timing(response):
+        query_count, db_time_ms = get_db_stats()
+        response.headers['Server-Timing'] = f'db;dur={db_time_ms:.1f};desc="{query_count} queries"'
+        logger.debug(f"{query_count} queries, {db_time_ms:.1f} ms DB time")
+        return response
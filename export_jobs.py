@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Background export jobs.
+
+Exports are queued as rows in the export_jobs table and processed by a
+separate worker process, so long-running exports never tie up a gunicorn
+web worker. Finished files are kept in EXPORT_JOB_DIR until they expire.
+
+Run the worker with:
+    python export_jobs.py
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from database import db
+from models import ExportJob
+from journey_export import FILTER_ARGS, ExportFilters, count_export_rows, iter_csv, write_excel
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Seconds the worker sleeps when the queue is empty
+POLL_INTERVAL = 2.0
+
+# Seconds between sweeps for expired files and stuck jobs
+CLEANUP_INTERVAL = 300
+
+# Running jobs without progress for this long (seconds) are assumed to belong to a dead worker
+STALE_JOB_SECONDS = 900
+
+
+def enqueue_export(user_id: int, export_format: str, args: Dict[str, Any]) -> ExportJob:
+    """
+    Queue an export job for the worker.
+
+    Args:
+        user_id: Owner of the journeys being exported
+        export_format: 'csv' or 'xlsx'
+        args: Export filter arguments, as accepted by ExportFilters.from_args
+
+    Returns:
+        ExportJob: The queued job
+
+    Raises:
+        ValueError: If the format or a filter argument is invalid
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    filter_args = {
+        key: str(args[key]) for key in FILTER_ARGS
+        if args.get(key) not in (None, '')
+    }
+    ExportFilters.from_args(filter_args)  # Reject bad filters now rather than in the worker
+
+    job = ExportJob(user_id=user_id, format=export_format, filters=json.dumps(filter_args))
+    db.session.add(job)
+    db.session.commit()
+
+    logger.info(f"Queued {export_format} export job {job.id} for user {user_id}")
+    return job
+
+
+def claim_next_job() -> Optional[int]:
+    """
+    Atomically claim the oldest queued job and mark it running.
+
+    SKIP LOCKED lets several workers poll the same table without handing
+    out a job twice.
+    """
+    job = db.session.execute(
+        db.select(ExportJob)
+        .where(ExportJob.status == 'queued')
+        .order_by(ExportJob.created_at, ExportJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+
+    if job is None:
+        db.session.rollback()
+        return None
+
+    job.status = 'running'
+    job.started_at = job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+    return job.id
+
+
+def _record_progress(job_id: int, rows_written: int) -> None:
+    # Progress goes through its own connection: committing the export's
+    # session would close the server-side cursor it is reading from
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(
+                db.update(ExportJob)
+                .where(ExportJob.id == job_id)
+                .values(rows_written=rows_written, heartbeat_at=datetime.utcnow())
+            )
+    except Exception as e:
+        # Progress is informational; never fail the export because of it
+        logger.warning(f"Could not record progress for export job {job_id}: {e}")
+
+
+def run_export_job(job_id: int, export_dir: str, ttl: timedelta) -> None:
+    """Write the export file for a claimed job and record the outcome."""
+    job = db.session.get(ExportJob, job_id)
+    final_path = os.path.join(export_dir, f'export_{job.id}.{job.format}')
+    partial_path = final_path + '.part'
+
+    try:
+        filters = ExportFilters.from_args(json.loads(job.filters or '{}'))
+        job.rows_total = count_export_rows(job.user_id, filters)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+        rows_written = 0
+
+        def progress(count: int) -> None:
+            nonlocal rows_written
+            rows_written = count
+            _record_progress(job_id, count)
+
+        os.makedirs(export_dir, exist_ok=True)
+        if job.format == 'csv':
+            with open(partial_path, 'w', encoding='utf-8', newline='') as target:
+                for chunk in iter_csv(job.user_id, filters, progress):
+                    target.write(chunk)
+        else:
+            with open(partial_path, 'wb') as target:
+                write_excel(job.user_id, target, filters, progress)
+        os.replace(partial_path, final_path)
+
+        db.session.rollback()  # End the read transaction before updating the job
+        job = db.session.get(ExportJob, job_id)
+        job.status = 'completed'
+        job.rows_written = rows_written
+        job.file_path = final_path
+        job.finished_at = datetime.utcnow()
+        job.expires_at = job.finished_at + ttl
+        db.session.commit()
+
+        logger.info(f"Export job {job_id} completed: {job.rows_written} rows written to {final_path}")
+
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed: {e}")
+        db.session.rollback()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        job = db.session.get(ExportJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def cleanup_export_jobs() -> None:
+    """Delete expired export files and fail jobs abandoned by a dead worker."""
+    now = datetime.utcnow()
+
+    expired = db.session.execute(
+        db.select(ExportJob).where(ExportJob.status == 'completed', ExportJob.expires_at < now)
+    ).scalars().all()
+    for job in expired:
+        if job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        job.status = 'expired'
+        job.file_path = None
+
+    # Judged by the last progress update, so a long export that is still being written is left alone
+    stale_cutoff = now - timedelta(seconds=STALE_JOB_SECONDS)
+    stale_count = db.session.execute(
+        db.update(ExportJob)
+        .where(
+            ExportJob.status == 'running',
+            db.func.coalesce(ExportJob.heartbeat_at, ExportJob.started_at) < stale_cutoff
+        )
+        .values(status='failed', error='Export worker stopped before finishing', finished_at=now)
+    ).rowcount
+    db.session.commit()
+
+    if expired or stale_count:
+        logger.info(f"Export cleanup: {len(expired)} expired, {stale_count} stale job(s)")
+
+
+def run_worker() -> None:
+    """Poll the export_jobs queue forever, processing one job at a time."""
+    from app import app
+
+    export_dir = app.config['EXPORT_JOB_DIR']
+    ttl = app.config['EXPORT_JOB_TTL']
+    logger.info(f"Export worker started, writing files to {export_dir}")
+
+    last_cleanup = 0.0
+    with app.app_context():
+        while True:
+            if time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                cleanup_export_jobs()
+                last_cleanup = time.monotonic()
+
+            job_id = claim_next_job()
+            if job_id is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            run_export_job(job_id, export_dir, ttl)
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    run_worker()
@@ -1,13 +1,50 @@
 # Gunicorn configuration file for PostcodeTracker
 import os
+import shutil
 
 # Server socket
-bind = "0.0.0.0:8005"
+bind = f"0.0.0.0:{os.environ.get('PORT', 8005)}"
 backlog = 2048
 
 # Worker processes
-workers = 4
-worker_class = "sync"
+# gthread runs several requests per process so slow postcodes.io lookups
+# don't block every other request; set GUNICORN_WORKER_CLASS=sync for the
+# old one-request-per-process behaviour
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# More than one thread silently turns sync workers into gthread ones
+threads = int(os.environ.get('GUNICORN_THREADS', 8 if worker_class == 'gthread' else 1))
+
+def use_gevent_wait_callback():
+    # Make psycopg2 wait for the database through gevent rather than
+    # blocking the whole worker
+    import psycopg2
+    from psycopg2 import extensions
+    from gevent.socket import wait_read, wait_write
+
+    def _gevent_wait_callback(connection, timeout=None):
+        while True:
+            state = connection.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(connection.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(connection.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+if worker_class == 'gevent':
+    # Streams (/journey/active/stream) stay open for a long time; gevent
+    # serves up to worker_connections of them per process on greenlets.
+    # Patch before the app is imported (preload_app) so its locks and
+    # threads are gevent ones
+    from gevent import monkey
+    monkey.patch_all()
+    use_gevent_wait_callback()
+
 worker_connections = 1000
 timeout = 60
 keepalive = 2
@@ -16,6 +53,41 @@ keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
 
+# Import the app once in the master and fork workers from it, so worker
+# boots and max_requests recycles skip imports and the schema check
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def post_fork(server, worker):
+    # The worker class can also be set with -k or in another config file,
+    # so tell the app the one gunicorn resolved
+    resolved_worker_class = server.cfg.worker_class_str
+    os.environ['GUNICORN_WORKER_CLASS'] = resolved_worker_class
+    if 'gevent' in resolved_worker_class.lower() and worker_class != 'gevent':
+        use_gevent_wait_callback()
+
+    # Connections opened in the master (schema check) must not be shared
+    # with forked workers; drop them from the pool without closing them
+    if preload_app:
+        from app import app, stream_connection_limit
+        from database import db
+        with app.app_context():
+            db.engine.dispose(close=False)
+        app.config['JOURNEY_STREAM_MAX_CONNECTIONS'] = stream_connection_limit(resolved_worker_class)
+
+# Metrics: workers write samples to files here and /metrics adds them up.
+# Must be set before the app (and prometheus_client) is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/postcode_tracker_metrics')
+
+def on_starting(server):
+    # Files left by a previous run would be counted again
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 # Logging
 accesslog = "-"  # Log to stdout
 errorlog = "-"   # Log to stderr
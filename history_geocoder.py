@@ -0,0 +1,170 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+from flask import current_app
+from database import db
+from metrics import record_cache_lookup
+from models import Journey
+from postcode_service import PostcodeService
+
+logger = logging.getLogger(__name__)
+
+MILES_PER_DEGREE_LATITUDE = 69.05
+
+# Users whose indexes are kept in memory per process (least recently used are dropped)
+MAX_CACHED_USERS = 1000
+
+# Grid cells are this much larger than the search radius, since the
+# projection below stretches east-west distances slightly between latitudes
+CELL_MARGIN = 1.25
+
+# New journeys read per refresh query
+REFRESH_BATCH_SIZE = 5000
+
+# Seconds before a user's index is rebuilt from scratch, so deleted journeys
+# and postcodes the resolver filled in on older journeys are picked up
+INDEX_TTL = 600
+
+
+class _UserIndex:
+    """
+    One user's known (position, postcode) pairs, bucketed on a square grid.
+
+    Positions are projected to miles (equirectangular, fine over the short
+    distances involved) and bucketed in cells a little larger than the
+    search radius, so a lookup only checks the 3 x 3 cells around the point.
+    """
+
+    def __init__(self, cell_miles: float, ttl: float = INDEX_TTL):
+        self.cell_miles = cell_miles
+        self.expires_at = time.monotonic() + ttl
+        self.cells: Dict[Tuple[int, int], List[Tuple[float, float, str]]] = defaultdict(list)
+        self.last_journey_id = 0
+        self.lock = threading.Lock()
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        y = latitude * MILES_PER_DEGREE_LATITUDE
+        x = longitude * MILES_PER_DEGREE_LATITUDE * math.cos(math.radians(latitude))
+        return math.floor(y / self.cell_miles), math.floor(x / self.cell_miles)
+
+    def add(self, latitude: float, longitude: float, postcode: str) -> None:
+        self.cells[self._cell(latitude, longitude)].append((latitude, longitude, postcode))
+
+    def nearest(self, latitude: float, longitude: float, max_miles: float) -> Optional[Tuple[str, float]]:
+        row, column = self._cell(latitude, longitude)
+        best = None
+        for cell_row in (row - 1, row, row + 1):
+            for cell_column in (column - 1, column, column + 1):
+                for point_latitude, point_longitude, postcode in self.cells.get((cell_row, cell_column), ()):
+                    distance = PostcodeService.haversine_miles(latitude, longitude, point_latitude, point_longitude)
+                    if distance <= max_miles and (best is None or distance < best[1]):
+                        best = (postcode, distance)
+        return best
+
+
+class HistoryGeocoder:
+    """
+    Fallback reverse geocoding from a user's own journey history.
+
+    When postcodes.io gives no postcode (both URLs down, or no postcode close
+    enough), a position within HISTORY_GEOCODE_MAX_MILES of one of the user's
+    earlier journey starts or ends is given that journey's postcode. A user's
+    index is built the first time it is needed and afterwards only reads
+    journeys newer than the ones it has seen, so it costs nothing while
+    postcodes.io is healthy. It is rebuilt every INDEX_TTL seconds, and
+    dropped when the user deletes journeys, so removed or corrected journeys
+    stop supplying postcodes.
+    """
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS, ttl: float = INDEX_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._indexes: 'OrderedDict[int, _UserIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_index(self, user_id: int, cell_miles: float) -> _UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None or index.cell_miles != cell_miles or index.expires_at <= time.monotonic():
+                index = _UserIndex(cell_miles, self.ttl)
+                self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a user's index in this process, e.g. after they delete journeys."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def _refresh(self, user_id: int, index: _UserIndex) -> None:
+        """Add the user's journeys newer than the last one indexed. Call with index.lock held."""
+        while True:
+            rows = db.session.execute(
+                db.select(
+                    Journey.id,
+                    Journey.start_latitude, Journey.start_longitude, Journey.start_postcode,
+                    Journey.start_postcode_approximate,
+                    Journey.end_latitude, Journey.end_longitude, Journey.end_postcode,
+                    Journey.end_postcode_approximate
+                )
+                .where(Journey.user_id == user_id, Journey.id > index.last_journey_id)
+                .order_by(Journey.id)
+                .limit(REFRESH_BATCH_SIZE)
+            ).all()
+            for row in rows:
+                # Only postcodes that came from postcodes.io, so guesses don't compound
+                if row.start_latitude is not None and row.start_postcode and not row.start_postcode_approximate:
+                    index.add(row.start_latitude, row.start_longitude, row.start_postcode)
+                if row.end_latitude is not None and row.end_postcode and not row.end_postcode_approximate:
+                    index.add(row.end_latitude, row.end_longitude, row.end_postcode)
+            if rows:
+                index.last_journey_id = rows[-1].id
+            if len(rows) < REFRESH_BATCH_SIZE:
+                return
+
+    def lookup(self, user_id: int, latitude: float, longitude: float) -> Optional[str]:
+        """
+        The postcode of the user's nearest earlier journey start or end within the configured distance.
+
+        Returns:
+            Optional[str]: The postcode, or None if there is none close enough
+            or the fallback is disabled (HISTORY_GEOCODE_MAX_MILES = 0)
+        """
+        max_miles = current_app.config['HISTORY_GEOCODE_MAX_MILES']
+        if not max_miles or user_id is None:
+            return None
+
+        index = self._get_index(user_id, max_miles * CELL_MARGIN)
+        with index.lock:
+            self._refresh(user_id, index)
+            match = index.nearest(latitude, longitude, max_miles)
+
+        record_cache_lookup('history_geocode', match is not None)
+        if match is None:
+            return None
+        postcode, distance = match
+        logger.warning(f"Using approximate postcode {postcode} from user {user_id}'s history for "
+                       f"({latitude}, {longitude}), {distance:.2f} miles away")
+        return postcode
+
+
+history_geocoder = HistoryGeocoder()
+
+
+def reverse_geocode(user_id: int, latitude: float, longitude: float) -> Tuple[Optional[str], bool]:
+    """
+    Postcode for coordinates from postcodes.io, falling back to the user's history.
+
+    Returns:
+        Tuple of (postcode or None, whether it is an approximate postcode from history)
+    """
+    postcode = PostcodeService.get_postcode_from_coordinates(latitude, longitude)
+    if postcode:
+        return postcode, False
+    postcode = history_geocoder.lookup(user_id, latitude, longitude)
+    return postcode, postcode is not None
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Optional
+from flask import Response, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# How long a stored response is replayed for
+KEY_TTL = timedelta(hours=24)
+
+# An in-progress key older than this belongs to a request that died (longer than the gunicorn timeout)
+IN_PROGRESS_TIMEOUT = timedelta(seconds=90)
+
+# Expired keys are purged at most this often per process, this many at a time
+PURGE_INTERVAL = 600
+PURGE_BATCH_SIZE = 1000
+
+# Attempts at storing a response once the view has returned
+STORE_ATTEMPTS = 3
+
+# session.info entries while a keyed view runs: its key's row id, and whether the view has committed
+RECORD_INFO_KEY = 'idempotency_record_id'
+COMMITTED_INFO_KEY = 'idempotency_committed'
+
+_last_purge = 0.0
+
+
+def _fingerprint() -> str:
+    """Identifies the request a key was first used with, so a reused key with a different request is refused."""
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.headers.get('Prefer', '')):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+@db.event.listens_for(db.session, 'before_commit')
+def _mark_committed(session) -> None:
+    """
+    Mark a running key 'committed' in the same transaction as the view's own writes.
+
+    From then on the key is never treated as abandoned and run again, even
+    if its response can't be stored afterwards.
+    """
+    record_id = session.info.get(RECORD_INFO_KEY)
+    if record_id is not None and not session.info.get(COMMITTED_INFO_KEY):
+        session.execute(
+            db.update(IdempotencyKey)
+            .where(IdempotencyKey.id == record_id, IdempotencyKey.status == 'in_progress')
+            .values(status='committed')
+        )
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _note_committed(session) -> None:
+    if session.info.get(RECORD_INFO_KEY) is not None:
+        session.info[COMMITTED_INFO_KEY] = True
+
+
+def _purge_expired() -> None:
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    expired_ids = (
+        db.select(IdempotencyKey.id)
+        .where(IdempotencyKey.expires_at < datetime.utcnow())
+        .limit(PURGE_BATCH_SIZE)
+    )
+    deleted = db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.id.in_(expired_ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if deleted:
+        logger.info(f"Purged {deleted} expired idempotency key(s)")
+
+
+def _claim(user_id: int, key: str, fingerprint: str):
+    """
+    Record that a request with this key has started.
+
+    Returns (claimed record, None), or (None, existing record) when the key
+    is already taken by a live request or a stored response.
+    """
+    now = datetime.utcnow()
+    for _ in range(2):
+        record = IdempotencyKey(
+            user_id=user_id, key=key, fingerprint=fingerprint, status='in_progress',
+            created_at=now, expires_at=now + KEY_TTL
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record, None
+        except IntegrityError:
+            db.session.rollback()
+
+        existing = db.session.execute(
+            db.select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        ).scalars().first()
+        if existing is None:
+            continue  # Deleted in the meantime; try again
+        abandoned = existing.status == 'in_progress' and existing.created_at < now - IN_PROGRESS_TIMEOUT
+        if existing.expires_at > now and not abandoned:
+            return None, existing
+        # Expired, or left behind by a request that never finished: start over
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.id == existing.id))
+        db.session.commit()
+    return None, None
+
+
+def _release(record_id: int) -> None:
+    """Forget a key whose request failed without committing anything, so a retry runs it again."""
+    try:
+        db.session.rollback()
+        db.session.execute(
+            db.delete(IdempotencyKey).where(IdempotencyKey.id == record_id, IdempotencyKey.status == 'in_progress')
+        )
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error releasing idempotency key {record_id}: {e}")
+        db.session.rollback()
+
+
+def _store(record_id: int, response: Response) -> None:
+    """Save the response for replays, retrying a few times; the view's writes are already committed."""
+    for attempt in range(1, STORE_ATTEMPTS + 1):
+        try:
+            db.session.execute(
+                db.update(IdempotencyKey)
+                .where(IdempotencyKey.id == record_id)
+                .values(status='completed', response_status=response.status_code,
+                        response_body=response.get_data(as_text=True))
+            )
+            db.session.commit()
+            return
+        except Exception as e:
+            logger.warning(f"Error storing response for idempotency key {record_id} (attempt {attempt}): {e}")
+            db.session.rollback()
+    logger.error(f"Gave up storing response for idempotency key {record_id}; retries with it will get 409")
+
+
+def _replay(existing: Optional[IdempotencyKey], fingerprint: str):
+    if existing is None:
+        return jsonify({'success': False, 'message': 'Could not reserve the idempotency key, please retry'}), 409
+    if existing.fingerprint != fingerprint:
+        return jsonify({
+            'success': False,
+            'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'
+        }), 422
+    if existing.status == 'committed' and existing.created_at < datetime.utcnow() - IN_PROGRESS_TIMEOUT:
+        return jsonify({
+            'success': False,
+            'message': 'The request with this idempotency key was carried out, but its response was not kept'
+        }), 409
+    if existing.status != 'completed':
+        return jsonify({
+            'success': False,
+            'message': 'A request with this idempotency key is still in progress'
+        }), 409
+
+    logger.info(f"Replaying stored response for idempotency key {existing.id}")
+    response = Response(existing.response_body, status=existing.response_status, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Decorator making a mutation safe to retry with an Idempotency-Key header.
+
+    Goes inside @require_auth. The first successful (2xx) response for a
+    user's key is stored for KEY_TTL and later requests with the same key
+    get it back, with an Idempotent-Replayed header, without running the
+    view again - so no repeat geocoding, distance calculation or writes.
+    Unsuccessful responses are not stored, so the client can retry them,
+    unless the view had already committed. The view's commit also marks
+    the key 'committed', so a key whose response couldn't be stored is
+    never mistaken for an abandoned one and run twice.
+    A key reused for a different request gets 422, and one whose first
+    request is still running gets 409. Requests without the header are
+    unaffected.
+    """
+    @wraps(view)
+    def decorated_function(current_user, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(current_user, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'success': False, 'message': f'{IDEMPOTENCY_HEADER} is too long'}), 400
+
+        fingerprint = _fingerprint()
+        record, existing = _claim(current_user.id, key, fingerprint)
+        if record is None:
+            return _replay(existing, fingerprint)
+        record_id = record.id
+
+        db.session.info[RECORD_INFO_KEY] = record_id
+        db.session.info[COMMITTED_INFO_KEY] = False
+        response = None
+        try:
+            response = make_response(view(current_user, *args, **kwargs))
+        finally:
+            db.session.info.pop(RECORD_INFO_KEY, None)
+            committed = db.session.info.pop(COMMITTED_INFO_KEY, False)
+            if response is None:
+                # The view raised; _release keeps the key if the view had committed
+                _release(record_id)
+
+        # Once the view has committed, its response is the outcome, whatever its status
+        if (committed or 200 <= response.status_code < 300) and not response.is_streamed:
+            _store(record_id, response)
+        else:
+            _release(record_id)
+
+        try:
+            _purge_expired()
+        except Exception as e:
+            logger.error(f"Error purging expired idempotency keys: {e}")
+            db.session.rollback()
+        return response
+    return decorated_function
@@ -0,0 +1,232 @@
+"""
+Change notifications for users' journeys.
+
+Every committed insert, update or delete of a journey wakes the streams
+(GET /journey/active/stream) of the user it belongs to:
+
+- within a process, through the JourneyNotifier below, from the session's
+  after_commit hook
+- across processes (other gunicorn workers, the journey resolver, the
+  export worker), through Postgres NOTIFY on the journey_changes channel,
+  sent in the same transaction so it is only delivered if it commits. Each
+  web worker that has streams open keeps one connection LISTENing and
+  passes notifications on to its JourneyNotifier.
+
+Notifications only say that something changed; streams re-read the
+active journey and send an event when it differs from the last one sent.
+"""
+
+import logging
+import select
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from database import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'journey_changes'
+
+# NOTIFY payload (and session.info entry) meaning "any user's journeys may have changed"
+ALL_USERS = '*'
+
+# Key in session.info for users whose journeys changed in the current transaction
+PENDING_KEY = 'changed_journey_users'
+
+# Seconds between checks that the LISTEN connection is still open, and before reconnecting after an error
+LISTEN_POLL_INTERVAL = 30
+LISTEN_RETRY_DELAY = 5
+
+
+class _Subscription:
+    def __init__(self, notifier: 'JourneyNotifier', user_id: int):
+        self._notifier = notifier
+        self.user_id = user_id
+
+    @property
+    def version(self) -> int:
+        """Changes seen so far; pass to wait() to sleep until the next one."""
+        return self._notifier._versions[self.user_id]
+
+    def wait(self, seen: int, timeout: float) -> bool:
+        """Block until the version moves past seen or timeout seconds pass. True if it moved."""
+        condition = self._notifier._condition
+        with condition:
+            return condition.wait_for(lambda: self._notifier._versions[self.user_id] != seen, timeout)
+
+
+class JourneyNotifier:
+    """
+    In-process wake-ups for streams, keyed by user.
+
+    A per-user counter is bumped on each change and kept only while the user
+    has a stream open. Streams read the counter before reading the database
+    and then wait for it to move, so a change committed in between is never
+    missed.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions: Dict[int, int] = {}
+        self._subscribers: Dict[int, int] = {}
+
+    @contextmanager
+    def subscribe(self, user_id: int) -> Iterator[_Subscription]:
+        with self._condition:
+            self._subscribers[user_id] = self._subscribers.get(user_id, 0) + 1
+            self._versions.setdefault(user_id, 0)
+        try:
+            yield _Subscription(self, user_id)
+        finally:
+            with self._condition:
+                self._subscribers[user_id] -= 1
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+                    del self._versions[user_id]
+
+    def publish(self, user_id: Optional[int]) -> None:
+        """Wake the streams of user_id, or of every user if it is None."""
+        with self._condition:
+            user_ids = list(self._versions) if user_id is None else [user_id]
+            woken = False
+            for subscribed_id in user_ids:
+                if subscribed_id in self._versions:
+                    self._versions[subscribed_id] += 1
+                    woken = True
+            if woken:
+                self._condition.notify_all()
+
+
+notifier = JourneyNotifier()
+
+
+class StreamSlots:
+    """
+    Caps the streams open at once in this process.
+
+    A slot is taken before the stream's response is returned and given back
+    when the server closes it, so a burst of simultaneous requests can't all
+    get past the limit before any stream has started.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def acquire(self, limit: int) -> bool:
+        with self._lock:
+            if self.in_use >= limit:
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def journey_changed(connection, session, user_id: Optional[int]) -> None:
+    """
+    Record that a user's journeys (or any user's, with None) changed in the current transaction.
+
+    Called from the Journey mapper events for ORM writes; bulk UPDATE and
+    DELETE statements call notify_journeys_changed instead.
+    """
+    payload = ALL_USERS if user_id is None else str(user_id)
+    if session is not None:
+        session.info.setdefault(PENDING_KEY, set()).add(payload)
+    if connection.dialect.name == 'postgresql':
+        connection.execute(db.text('SELECT pg_notify(:channel, :payload)'), {'channel': CHANNEL, 'payload': payload})
+
+
+def notify_journeys_changed(user_id: Optional[int]) -> None:
+    """journey_changed for a bulk statement run in db.session."""
+    journey_changed(db.session.connection(), db.session(), user_id)
+
+
+def _publish_payload(payload: str) -> None:
+    if payload == ALL_USERS:
+        notifier.publish(None)
+    else:
+        try:
+            notifier.publish(int(payload))
+        except ValueError:
+            logger.warning(f"Ignoring malformed {CHANNEL} notification {payload!r}")
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _publish_committed_changes(session) -> None:
+    for payload in session.info.pop(PENDING_KEY, ()):
+        _publish_payload(payload)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back_changes(session) -> None:
+    session.info.pop(PENDING_KEY, None)
+
+
+class PostgresListener:
+    """
+    One LISTEN connection per process, passing journey_changes notifications to the notifier.
+
+    Started by the first stream a worker serves (so forked gunicorn workers
+    each get their own) and kept for the life of the process. After a lost
+    connection every stream is woken to re-check, since notifications sent
+    meanwhile are gone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self, app) -> None:
+        if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app,), name='journey-listener', daemon=True)
+            self._thread.start()
+
+    def _listen(self, app) -> None:
+        with app.app_context():
+            connection = db.engine.raw_connection()
+        # Keep this connection out of the pool for good
+        connection.detach()
+        dbapi_connection = connection.dbapi_connection
+        try:
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            logger.info(f"Listening for {CHANNEL} notifications")
+            notifier.publish(None)
+            while True:
+                readable, _, _ = select.select([dbapi_connection], [], [], LISTEN_POLL_INTERVAL)
+                if not readable:
+                    # Nothing for a while: make sure the connection is still there
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    continue
+                dbapi_connection.poll()
+                payloads = set()
+                while dbapi_connection.notifies:
+                    payloads.add(dbapi_connection.notifies.pop(0).payload)
+                for payload in payloads:
+                    _publish_payload(payload)
+        finally:
+            connection.close()
+
+    def _run(self, app) -> None:
+        while True:
+            try:
+                self._listen(app)
+            except Exception as e:
+                logger.error(f"{CHANNEL} listener failed, reconnecting in {LISTEN_RETRY_DELAY}s: {e}")
+                time.sleep(LISTEN_RETRY_DELAY)
+
+
+postgres_listener = PostgresListener()
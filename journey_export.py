@@ -0,0 +1,344 @@
+import csv
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Mapping, Optional
+from database import db
+from models import Journey
+
+logger = logging.getLogger(__name__)
+
+# Column layout shared by the CSV/Excel exports and the bulk import
+EXPORT_HEADERS = [
+    'Date', 'Postcode From', 'Postcode To', 'Client Name', 'Recharge to Client', 'Description', 'Total Miles'
+]
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+SUMMARY_HEADERS = ['Month', 'Client Name', 'Trips', 'Total Miles', 'Recharge Miles']
+
+# Query arguments understood by ExportFilters.from_args
+FILTER_ARGS = ('from', 'to', 'client_name', 'recharge_to_client')
+
+# Excel header styling (blue background with white text) and width cap
+EXCEL_HEADER_COLOR = '4472C4'
+EXCEL_MAX_COLUMN_WIDTH = 50
+
+
+@dataclass
+class ExportFilters:
+    """Optional filters for exports and summaries, applied in the query."""
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None  # Exclusive upper bound
+    client_name: Optional[str] = None
+    recharge_to_client: Optional[bool] = None
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> 'ExportFilters':
+        """
+        Build filters from query string arguments.
+
+        Args:
+            args: Request arguments; 'from' and 'to' are inclusive dates
+                (YYYY-MM-DD or ISO 8601), 'client_name' matches case-insensitively
+                and 'recharge_to_client' takes yes/no/true/false
+
+        Returns:
+            ExportFilters: The parsed filters
+
+        Raises:
+            ValueError: If an argument cannot be parsed
+        """
+        filters = cls()
+
+        date_from = (args.get('from') or '').strip()
+        if date_from:
+            filters.date_from = _parse_filter_date(date_from, 'from')
+
+        date_to = (args.get('to') or '').strip()
+        if date_to:
+            filters.date_to = _parse_filter_date(date_to, 'to')
+            if len(date_to) == 10:
+                # A bare date includes the whole day
+                filters.date_to += timedelta(days=1)
+
+        client_name = (args.get('client_name') or '').strip()
+        if client_name:
+            filters.client_name = client_name
+
+        recharge = (args.get('recharge_to_client') or '').strip().lower()
+        if recharge in ('yes', 'true', '1'):
+            filters.recharge_to_client = True
+        elif recharge in ('no', 'false', '0'):
+            filters.recharge_to_client = False
+        elif recharge:
+            raise ValueError("recharge_to_client must be yes or no")
+
+        return filters
+
+    def apply(self, query):
+        """Add the WHERE clauses for these filters to a select."""
+        if self.date_from is not None:
+            query = query.where(Journey.start_time >= self.date_from)
+        if self.date_to is not None:
+            query = query.where(Journey.start_time < self.date_to)
+        if self.client_name is not None:
+            query = query.where(db.func.lower(Journey.client_name) == self.client_name.lower())
+        if self.recharge_to_client is not None:
+            query = query.where(Journey.recharge_to_client.is_(self.recharge_to_client))
+        return query
+
+
+def _parse_filter_date(value: str, name: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date: {value}")
+
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back each formatted line."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_export_rows(user_id: int, filters: Optional[ExportFilters] = None) -> Iterator[Any]:
+    """
+    Stream a user's journeys (active and completed) newest first.
+
+    Only the exported columns are selected, and rows are fetched in batches
+    of EXPORT_BATCH_SIZE through a server-side cursor, so memory stays flat
+    however long the user's history is.
+    """
+    query = (
+        db.select(
+            Journey.id,
+            Journey.start_time,
+            Journey.start_postcode,
+            Journey.end_postcode,
+            Journey.client_name,
+            Journey.recharge_to_client,
+            Journey.description,
+            Journey.distance_miles
+        )
+        .where(Journey.user_id == user_id)
+        .order_by(Journey.start_time.desc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if filters is not None:
+        query = filters.apply(query)
+    yield from db.session.execute(query)
+
+
+def format_export_date(row: Any) -> str:
+    """Date component only (no time), or '' if it cannot be formatted."""
+    try:
+        if row.start_time:
+            return row.start_time.strftime('%Y-%m-%d')
+    except Exception as e:
+        logger.warning(f"Error formatting date for journey {row.id}: {e}")
+    return ''
+
+
+def format_recharge(row: Any) -> str:
+    """Yes/No for the recharge field, '' when it was never set."""
+    return 'Yes' if row.recharge_to_client else 'No' if row.recharge_to_client is not None else ''
+
+
+def count_export_rows(user_id: int, filters: Optional[ExportFilters] = None) -> int:
+    """Number of journeys an export with these filters will contain."""
+    query = db.select(db.func.count(Journey.id)).where(Journey.user_id == user_id)
+    if filters is not None:
+        query = filters.apply(query)
+    return db.session.execute(query).scalar() or 0
+
+
+def iter_csv(user_id: int, filters: Optional[ExportFilters] = None,
+             progress: Optional[Callable[[int], None]] = None) -> Iterator[str]:
+    """
+    Generate the journeys CSV in chunks of EXPORT_BATCH_SIZE lines.
+
+    If given, progress is called with the number of rows written so far
+    each time a chunk is produced.
+    """
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_HEADERS)
+
+    lines = []
+    rows_written = 0
+    for row in iter_export_rows(user_id, filters):
+        lines.append(writer.writerow([
+            format_export_date(row),                                   # Date (without time)
+            row.start_postcode,                                        # Postcode From (Start Postcode)
+            row.end_postcode or '',                                    # Postcode To (End Postcode)
+            row.client_name or '',                                     # Client Name
+            format_recharge(row),                                      # Recharge to Client (Yes/No)
+            row.description or '',                                     # Description
+            f"{row.distance_miles:.2f}" if row.distance_miles else ''  # Total Miles
+        ]))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            rows_written += len(lines)
+            yield ''.join(lines)
+            lines = []
+            if progress:
+                progress(rows_written)
+
+    if lines:
+        rows_written += len(lines)
+        yield ''.join(lines)
+    if progress:
+        progress(rows_written)
+
+
+def excel_column_widths(user_id: int, filters: Optional[ExportFilters] = None) -> List[int]:
+    """
+    Work out Excel column widths with a single aggregate query.
+
+    Write-only worksheets need their column widths before the first row is
+    written, so instead of measuring every cell after the fact the longest
+    value per column is computed by the database.
+    """
+    query = db.select(
+        db.func.count(Journey.id),
+        db.func.max(db.func.length(Journey.start_postcode)),
+        db.func.max(db.func.length(Journey.end_postcode)),
+        db.func.max(db.func.length(Journey.client_name)),
+        db.func.max(db.func.length(Journey.description)),
+        db.func.max(db.func.length(db.cast(Journey.distance_miles, db.String)))
+    ).where(Journey.user_id == user_id)
+    if filters is not None:
+        query = filters.apply(query)
+    stats = db.session.execute(query).one()
+    count, start_postcode, end_postcode, client_name, description, distance = stats
+
+    value_lengths = [
+        len('YYYY-MM-DD') if count else 0,  # Date
+        start_postcode or 0,                # Postcode From
+        end_postcode or 0,                  # Postcode To
+        client_name or 0,                   # Client Name
+        len('Yes') if count else 0,         # Recharge to Client
+        description or 0,                   # Description
+        distance or 0                       # Total Miles
+    ]
+    return [
+        min(max(len(header), length) + 2, EXCEL_MAX_COLUMN_WIDTH)
+        for header, length in zip(EXPORT_HEADERS, value_lengths)
+    ]
+
+
+def write_excel(user_id: int, target: BinaryIO, filters: Optional[ExportFilters] = None,
+                progress: Optional[Callable[[int], None]] = None) -> None:
+    """
+    Write the journeys workbook to target using a write-only (streaming) workbook.
+
+    Rows go straight from the server-side cursor into the worksheet XML, so
+    memory use does not grow with the number of journeys. A second sheet holds
+    the per-client monthly summary for the same filters. If given, progress is
+    called with the number of rows written every EXPORT_BATCH_SIZE rows.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Journeys")
+
+    # Column widths must be set before any rows are appended
+    for col, width in enumerate(excel_column_widths(user_id, filters), 1):
+        sheet.column_dimensions[get_column_letter(col)].width = width
+
+    header_fill = PatternFill(start_color=EXCEL_HEADER_COLOR, end_color=EXCEL_HEADER_COLOR, fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True)
+
+    def header_row(worksheet, headers):
+        cells = []
+        for header in headers:
+            cell = WriteOnlyCell(worksheet, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cells.append(cell)
+        return cells
+
+    sheet.append(header_row(sheet, EXPORT_HEADERS))
+
+    rows_written = 0
+    for row in iter_export_rows(user_id, filters):
+        sheet.append([
+            format_export_date(row),                                      # Date (without time)
+            row.start_postcode,                                           # Postcode From (Start Postcode)
+            row.end_postcode or '',                                       # Postcode To (End Postcode)
+            row.client_name or '',                                        # Client Name
+            format_recharge(row),                                         # Recharge to Client (Yes/No)
+            row.description or '',                                        # Description
+            float(row.distance_miles) if row.distance_miles else ''       # Total Miles
+        ])
+        rows_written += 1
+        if progress and rows_written % EXPORT_BATCH_SIZE == 0:
+            progress(rows_written)
+
+    if progress:
+        progress(rows_written)
+
+    summary_sheet = workbook.create_sheet("Summary")
+    for col, header in enumerate(SUMMARY_HEADERS, 1):
+        summary_sheet.column_dimensions[get_column_letter(col)].width = max(len(header) + 2, 14)
+    summary_sheet.column_dimensions['B'].width = EXCEL_MAX_COLUMN_WIDTH
+    summary_sheet.append(header_row(summary_sheet, SUMMARY_HEADERS))
+    for entry in journey_summary(user_id, filters):
+        summary_sheet.append([
+            entry['month'],
+            entry['client_name'] or '',
+            entry['trips'],
+            entry['total_miles'],
+            entry['recharge_miles']
+        ])
+
+    workbook.save(target)
+
+
+def _month_expression():
+    """SQL expression for the YYYY-MM month of a journey's start time."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.func.to_char(Journey.start_time, 'YYYY-MM')
+    return db.func.strftime('%Y-%m', Journey.start_time)
+
+
+def journey_summary(user_id: int, filters: Optional[ExportFilters] = None) -> List[Dict[str, Any]]:
+    """
+    Miles and trips per client per month for completed journeys.
+
+    The aggregation is a single GROUP BY in the database, so only one row per
+    client and month comes back however many journeys match.
+    """
+    month = _month_expression().label('month')
+    query = (
+        db.select(
+            month,
+            Journey.client_name,
+            db.func.count(Journey.id).label('trips'),
+            db.func.coalesce(db.func.sum(Journey.distance_miles), 0.0).label('total_miles'),
+            db.func.coalesce(
+                db.func.sum(db.case((Journey.recharge_to_client.is_(True), Journey.distance_miles), else_=0.0)),
+                0.0
+            ).label('recharge_miles')
+        )
+        .where(Journey.user_id == user_id, Journey.end_time.isnot(None))
+        .group_by(month, Journey.client_name)
+        .order_by(month, Journey.client_name)
+    )
+    if filters is not None:
+        query = filters.apply(query)
+
+    return [
+        {
+            'month': row.month,
+            'client_name': row.client_name,
+            'trips': row.trips,
+            'total_miles': round(row.total_miles, 2),
+            'recharge_miles': round(row.recharge_miles, 2)
+        }
+        for row in db.session.execute(query)
+    ]
@@ -0,0 +1,205 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from database import db
+from models import Journey
+from postcode_service import PostcodeService
+from spatial import geohash_cover, geohash_prefix_end
+
+logger = logging.getLogger(__name__)
+
+# Journey ends that can be plotted on the map
+MAP_KINDS = ('start', 'end')
+
+# Grid cells across one 256px map tile (so one cluster per 32px square)
+CELLS_PER_TILE = 8
+
+# Upper bound on grid cells per request; coarser cells are used beyond it
+MAX_MAP_CELLS = 4096
+
+MAX_ZOOM = 22
+
+# Upper bound on the radius of a "near" search
+MAX_NEAR_RADIUS_MILES = 50.0
+
+
+@dataclass
+class BoundingBox:
+    """A map viewport in degrees."""
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float
+
+    @classmethod
+    def from_arg(cls, value: str) -> 'BoundingBox':
+        """
+        Parse a bbox query argument.
+
+        Args:
+            value: 'min_lon,min_lat,max_lon,max_lat', the usual (GeoJSON) order
+
+        Returns:
+            BoundingBox: The parsed box
+
+        Raises:
+            ValueError: If the box is malformed or out of range
+        """
+        try:
+            min_longitude, min_latitude, max_longitude, max_latitude = (float(part) for part in value.split(','))
+        except (ValueError, AttributeError):
+            raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+        if not (-90 <= min_latitude < max_latitude <= 90) or not (-180 <= min_longitude < max_longitude <= 180):
+            raise ValueError('bbox is out of range or empty')
+        return cls(min_latitude, min_longitude, max_latitude, max_longitude)
+
+
+def grid_cell_degrees(bbox: BoundingBox, zoom: int) -> float:
+    """
+    Grid cell size in degrees for a zoom level.
+
+    A web map tile spans 360 / 2**zoom degrees of longitude, so cells are a
+    fixed fraction of a tile and cover about the same screen area at every
+    zoom. If the box would need more than MAX_MAP_CELLS cells (a zoom that
+    doesn't match the box), the cells are doubled until it doesn't.
+    """
+    area = (bbox.max_latitude - bbox.min_latitude) * (bbox.max_longitude - bbox.min_longitude)
+    cell = 360.0 / 2 ** zoom / CELLS_PER_TILE
+    while area / (cell * cell) > MAX_MAP_CELLS:
+        cell *= 2
+    return cell
+
+
+def cluster_journey_points(user_id: int, bbox: BoundingBox, zoom: int, kinds: Tuple[str, ...] = MAP_KINDS,
+                           filters=None) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Cluster a user's journey start and/or end points inside a map viewport.
+
+    Points are grouped into a square grid with a GROUP BY in the database,
+    and each cluster is reported at the mean position of its points. Only one
+    row per occupied cell comes back, so the result size depends on the
+    viewport and zoom rather than on how many journeys the user has. The
+    range conditions are served by the (user_id, latitude, longitude)
+    indexes on journeys.
+
+    Args:
+        user_id: Owner of the journeys
+        bbox: Viewport to cluster within
+        zoom: Web map zoom level (0-22)
+        kinds: Which ends of the journeys to include ('start', 'end')
+        filters: Optional journey_export.ExportFilters
+
+    Returns:
+        Tuple of (clusters, cell size in degrees). Each cluster has kind,
+        latitude, longitude, count, and journey_id when it holds one journey.
+    """
+    cell = grid_cell_degrees(bbox, zoom)
+    clusters = []
+
+    for kind in kinds:
+        latitude = getattr(Journey, f'{kind}_latitude')
+        longitude = getattr(Journey, f'{kind}_longitude')
+        cell_y = db.func.floor(latitude / cell).label('cell_y')
+        cell_x = db.func.floor(longitude / cell).label('cell_x')
+
+        query = (
+            db.select(
+                db.func.count(Journey.id).label('count'),
+                db.func.avg(latitude).label('latitude'),
+                db.func.avg(longitude).label('longitude'),
+                db.func.min(Journey.id).label('journey_id')
+            )
+            .where(
+                Journey.user_id == user_id,
+                latitude.between(bbox.min_latitude, bbox.max_latitude),
+                longitude.between(bbox.min_longitude, bbox.max_longitude)
+            )
+            .group_by(cell_y, cell_x)
+        )
+        if filters is not None:
+            query = filters.apply(query)
+
+        for row in db.session.execute(query):
+            clusters.append({
+                'kind': kind,
+                'latitude': round(row.latitude, 6),
+                'longitude': round(row.longitude, 6),
+                'count': row.count,
+                'journey_id': row.journey_id if row.count == 1 else None
+            })
+
+    return clusters, cell
+
+
+def parse_map_kinds(value: Optional[str]) -> Tuple[str, ...]:
+    """Parse the kind argument: start, end or both (the default)."""
+    value = (value or 'both').strip().lower()
+    if value == 'both':
+        return MAP_KINDS
+    if value in MAP_KINDS:
+        return (value,)
+    raise ValueError('kind must be start, end or both')
+
+
+def _prefix_conditions(column, prefixes: List[str]):
+    """column starts with one of prefixes, as index-friendly range conditions."""
+    conditions = []
+    for prefix in prefixes:
+        end = geohash_prefix_end(prefix)
+        conditions.append(db.and_(column >= prefix, column < end) if end else column >= prefix)
+    return conditions
+
+
+def journeys_near(user_id: int, latitude: float, longitude: float, radius_miles: float,
+                  kinds: Tuple[str, ...] = MAP_KINDS, filters=None) -> List[Dict[str, Any]]:
+    """
+    A user's journeys that started and/or ended within radius_miles of a point.
+
+    Candidates are found with range scans on the (user_id, geohash) indexes
+    over the few geohash cells that cover the circle, then checked exactly
+    with the haversine distance. Nearest first.
+
+    Args:
+        user_id: Owner of the journeys
+        latitude, longitude: The site
+        radius_miles: Search radius, up to MAX_NEAR_RADIUS_MILES
+        kinds: Which ends of the journeys to match ('start', 'end')
+        filters: Optional journey_export.ExportFilters
+
+    Returns:
+        List of journey dictionaries, each with start_distance_from_site and
+        end_distance_from_site in miles (None for an end that didn't match)
+    """
+    prefixes = geohash_cover(latitude, longitude, radius_miles)
+    conditions = []
+    for kind in kinds:
+        conditions.extend(_prefix_conditions(getattr(Journey, f'{kind}_geohash'), prefixes))
+
+    query = db.select(Journey).where(Journey.user_id == user_id, db.or_(*conditions))
+    if filters is not None:
+        query = filters.apply(query)
+
+    matches = []
+    for journey in db.session.execute(query).scalars():
+        distances = {}
+        for kind in MAP_KINDS:
+            point_latitude = getattr(journey, f'{kind}_latitude')
+            point_longitude = getattr(journey, f'{kind}_longitude')
+            distance = None
+            if kind in kinds and point_latitude is not None and point_longitude is not None:
+                distance = PostcodeService.haversine_miles(latitude, longitude, point_latitude, point_longitude)
+                if distance > radius_miles:
+                    distance = None
+            distances[kind] = distance
+
+        nearest = min((distance for distance in distances.values() if distance is not None), default=None)
+        if nearest is None:
+            continue
+        matches.append((nearest, {
+            **journey.to_dict(),
+            'start_distance_from_site': round(distances['start'], 2) if distances['start'] is not None else None,
+            'end_distance_from_site': round(distances['end'], 2) if distances['end'] is not None else None
+        }))
+
+    matches.sort(key=lambda match: match[0])
+    return [journey for _, journey in matches]
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+import logging
+import math
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Subset of the export columns (journey_export.EXPORT_HEADERS) an import must have
+REQUIRED_HEADERS = ['Date', 'Postcode From', 'Postcode To']
+
+# Upper bound on rows accepted in a single import request
+MAX_IMPORT_ROWS = 50000
+
+POSTCODE_PATTERN = re.compile(r'^[A-Z]{1,2}[0-9][A-Z0-9]? ?[0-9][A-Z]{2}$')
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import file cannot be parsed as a whole."""
+
+
+def parse_import_file(filename: str, content: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse an uploaded CSV or JSON file into a list of row dictionaries.
+
+    Args:
+        filename: Original filename, used to pick the parser (.json or CSV)
+        content: Raw file content
+
+    Returns:
+        List[Dict[str, Any]]: Rows keyed by export column name
+    """
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFormatError('File must be UTF-8 encoded')
+
+    if filename and filename.lower().endswith('.json'):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f'Invalid JSON: {e}')
+        return parse_import_rows(data)
+
+    reader = csv.DictReader(io.StringIO(text))
+    headers = [header.strip() for header in (reader.fieldnames or [])]
+    missing = [header for header in REQUIRED_HEADERS if header not in headers]
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+    reader.fieldnames = headers
+    return list(reader)
+
+
+def parse_import_rows(data: Any) -> List[Dict[str, Any]]:
+    """Accept either a list of rows or an object with a 'journeys' list."""
+    if isinstance(data, dict):
+        data = data.get('journeys')
+    if not isinstance(data, list):
+        raise ImportFormatError("Expected a list of journeys or an object with a 'journeys' list")
+    if not all(isinstance(row, dict) for row in data):
+        raise ImportFormatError('Each journey must be an object keyed by export column name')
+    return data
+
+
+def _clean(value: Any) -> str:
+    return str(value).strip() if value is not None else ''
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _parse_recharge(value: str) -> Tuple[Optional[bool], bool]:
+    """Return (recharge_to_client, ok) for a Yes/No/blank cell."""
+    lowered = value.lower()
+    if not lowered:
+        return None, True
+    if lowered in ('yes', 'y', 'true', '1'):
+        return True, True
+    if lowered in ('no', 'n', 'false', '0'):
+        return False, True
+    return None, False
+
+
+def validate_import_rows(rows: List[Dict[str, Any]], first_row_number: int = 2) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Validate import rows and convert them to journey column values.
+
+    Args:
+        rows: Parsed rows keyed by export column name
+        first_row_number: Number reported for the first row (2 for a CSV with a header line)
+
+    Returns:
+        Tuple of (valid journeys, per-row errors). Each valid journey carries its
+        'row' number so later failures can still be reported against the input.
+    """
+    valid = []
+    errors = []
+
+    for offset, row in enumerate(rows):
+        row_number = first_row_number + offset
+        row_errors = []
+
+        date_text = _clean(row.get('Date'))
+        start_postcode = _clean(row.get('Postcode From')).upper()
+        end_postcode = _clean(row.get('Postcode To')).upper()
+        client_name = _clean(row.get('Client Name'))
+        description = _clean(row.get('Description'))
+        miles_text = _clean(row.get('Total Miles'))
+
+        journey_date = _parse_date(date_text) if date_text else None
+        if not date_text:
+            row_errors.append('Date is required')
+        elif journey_date is None:
+            row_errors.append(f'Invalid date: {date_text}')
+
+        if not start_postcode or not end_postcode:
+            row_errors.append('Start and end postcodes are required')
+        elif not POSTCODE_PATTERN.match(start_postcode) or not POSTCODE_PATTERN.match(end_postcode):
+            row_errors.append('Invalid postcode format')
+        elif start_postcode == end_postcode:
+            row_errors.append('Start and end postcodes cannot be the same')
+
+        recharge_to_client, recharge_ok = _parse_recharge(_clean(row.get('Recharge to Client')))
+        if not recharge_ok:
+            row_errors.append('Recharge to Client must be Yes or No')
+
+        distance_miles = None
+        if miles_text:
+            try:
+                distance_miles = round(float(miles_text), 2)
+                # float() accepts 'inf' and 'nan', which would poison summaries and exports
+                if not math.isfinite(distance_miles) or distance_miles < 0:
+                    raise ValueError
+            except ValueError:
+                row_errors.append(f'Invalid Total Miles: {miles_text}')
+
+        if len(client_name) > 100:
+            row_errors.append('Client name must be at most 100 characters')
+
+        if row_errors:
+            errors.append({'row': row_number, 'errors': row_errors})
+            continue
+
+        valid.append({
+            'row': row_number,
+            'start_postcode': start_postcode,
+            'end_postcode': end_postcode,
+            'start_time': journey_date,
+            'end_time': journey_date,  # Imported journeys are completed, like manual ones
+            'distance_miles': distance_miles,
+            'client_name': client_name or None,
+            'recharge_to_client': recharge_to_client,
+            'description': description or None
+        })
+
+    return valid, errors
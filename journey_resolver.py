@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Deferred journey resolution.
+
+When a journey is ended with "Prefer: respond-async", /journey/end stores
+the end coordinates and time and returns immediately with the journey in
+the 'pending' resolution state. This worker fills in end_postcode and
+distance_miles afterwards, retrying upstream failures with exponential
+backoff.
+
+Run the resolver with:
+    python journey_resolver.py
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from database import db
+from models import Journey
+from journey_trail import trail_distance
+from history_geocoder import history_geocoder
+from postcode_service import PostcodeService
+
+logger = logging.getLogger(__name__)
+
+# Journeys locked and resolved per pass
+BATCH_SIZE = 10
+
+# Seconds the resolver sleeps when nothing is due
+POLL_INTERVAL = 1.0
+
+# Backoff between attempts: BASE_DELAY * 2 ** attempts, capped at MAX_DELAY seconds
+BASE_DELAY = 5
+MAX_DELAY = 600
+
+# Attempts before a journey is given up on
+MAX_ATTEMPTS = 8
+
+# Seconds a claimed journey is reserved for the resolver that claimed it;
+# if that resolver dies, another one picks the journey up after this
+CLAIM_SECONDS = 300
+
+
+def mark_pending(journey: Journey, latitude: float, longitude: float) -> None:
+    """Record the end of a journey now and leave postcode and distance for the resolver."""
+    journey.end_latitude = latitude
+    journey.end_longitude = longitude
+    journey.end_time = datetime.utcnow()
+    journey.end_postcode = None
+    journey.end_postcode_approximate = None
+    journey.distance_miles = None
+    journey.resolution_status = 'pending'
+    journey.resolution_attempts = 0
+    journey.next_resolution_at = journey.end_time
+
+
+def claim_due_journeys(batch_size: int = BATCH_SIZE) -> Tuple[List[int], datetime]:
+    """
+    Claim up to batch_size due journeys for this resolver.
+
+    The rows are locked with SKIP LOCKED only long enough to move their
+    next_resolution_at CLAIM_SECONDS ahead, which hides them from other
+    resolvers, and the claim is committed straight away. Returns the
+    claimed ids and the claim's next_resolution_at.
+    """
+    claimed_until = datetime.utcnow() + timedelta(seconds=CLAIM_SECONDS)
+    journey_ids = db.session.execute(
+        db.select(Journey.id)
+        .where(Journey.resolution_status == 'pending', Journey.next_resolution_at <= datetime.utcnow())
+        .order_by(Journey.next_resolution_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if journey_ids:
+        db.session.execute(
+            db.update(Journey)
+            .where(Journey.id.in_(journey_ids))
+            .values(next_resolution_at=claimed_until)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return journey_ids, claimed_until
+
+
+def _claimed_journey(journey_id: int, claimed_until: datetime, lock: bool = False) -> Optional[Journey]:
+    """The journey if it is still pending under this claim (not deleted, ended again or reclaimed)."""
+    query = db.select(Journey).where(
+        Journey.id == journey_id,
+        Journey.resolution_status == 'pending',
+        Journey.next_resolution_at == claimed_until
+    )
+    if lock:
+        query = query.with_for_update()
+    return db.session.execute(query).scalars().first()
+
+
+def resolve_journey(journey_id: int, claimed_until: datetime) -> None:
+    """
+    Make one resolution attempt for a journey claimed by claim_due_journeys.
+
+    On success the journey becomes 'resolved'. On failure the next attempt
+    is scheduled with exponential backoff, and after MAX_ATTEMPTS the journey
+    is 'resolved' without a distance if its postcode is known (as a
+    synchronous /journey/end would do), taking an approximate postcode from
+    the user's history if need be, or 'failed' if there is none.
+
+    The postcodes.io calls and the history lookup run with no transaction
+    open. The outcome is then written under a brief row lock, and dropped
+    if the journey changed hands in the meantime.
+    """
+    journey = _claimed_journey(journey_id, claimed_until)
+    if journey is None:
+        db.session.rollback()
+        return
+    user_id = journey.user_id
+    start_postcode = journey.start_postcode
+    end_postcode = journey.end_postcode
+    latitude, longitude = journey.end_latitude, journey.end_longitude
+    attempts = journey.resolution_attempts + 1
+    distance_miles = trail_distance(journey, latitude, longitude)
+    db.session.rollback()  # Hold no transaction or connection during the upstream calls
+
+    if not end_postcode:
+        end_postcode = PostcodeService.get_postcode_from_coordinates(latitude, longitude)
+    if end_postcode and distance_miles is None:
+        distance_miles = PostcodeService.calculate_distance(start_postcode, end_postcode)
+
+    approximate = None
+    if not end_postcode and attempts >= MAX_ATTEMPTS:
+        end_postcode = history_geocoder.lookup(user_id, latitude, longitude)
+        approximate = end_postcode is not None
+        db.session.rollback()
+
+    journey = _claimed_journey(journey_id, claimed_until, lock=True)
+    if journey is None:
+        logger.info(f"Journey {journey_id} changed while it was being resolved; discarding the result")
+        db.session.rollback()
+        return
+
+    journey.resolution_attempts = attempts
+    journey.end_postcode = end_postcode
+    if end_postcode and distance_miles is not None:
+        journey.distance_miles = distance_miles
+        journey.resolution_status = 'resolved'
+        journey.next_resolution_at = None
+        logger.info(f"Resolved journey {journey.id}: {journey.end_postcode}, distance: {journey.distance_miles}")
+    elif attempts >= MAX_ATTEMPTS:
+        if approximate is not None:
+            journey.end_postcode_approximate = approximate
+        journey.resolution_status = 'resolved' if journey.end_postcode else 'failed'
+        journey.next_resolution_at = None
+        logger.warning(f"Gave up resolving journey {journey.id} after {journey.resolution_attempts} attempts "
+                       f"(postcode: {journey.end_postcode})")
+    else:
+        delay = min(BASE_DELAY * 2 ** journey.resolution_attempts, MAX_DELAY)
+        journey.next_resolution_at = datetime.utcnow() + timedelta(seconds=delay)
+        logger.info(f"Journey {journey.id} not resolved (attempt {journey.resolution_attempts}), retrying in {delay}s")
+    db.session.commit()
+
+
+def resolve_pending_journeys(batch_size: int = BATCH_SIZE) -> int:
+    """
+    Resolve the journeys that are due, returning how many were attempted.
+
+    Several resolvers can run at once; each works on the journeys it claimed.
+    """
+    journey_ids, claimed_until = claim_due_journeys(batch_size)
+
+    for journey_id in journey_ids:
+        try:
+            resolve_journey(journey_id, claimed_until)
+        except Exception as e:
+            logger.error(f"Error resolving journey {journey_id}: {e}")
+            db.session.rollback()
+            db.session.execute(
+                db.update(Journey)
+                .where(Journey.id == journey_id, Journey.next_resolution_at == claimed_until)
+                .values(next_resolution_at=datetime.utcnow() + timedelta(seconds=BASE_DELAY))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+    return len(journey_ids)
+
+
+def run_resolver() -> None:
+    """Resolve pending journeys forever."""
+    from app import app
+
+    logger.info("Journey resolver started")
+    with app.app_context():
+        while True:
+            try:
+                attempted = resolve_pending_journeys()
+            except Exception as e:
+                logger.error(f"Journey resolver pass failed: {e}")
+                db.session.rollback()
+                attempted = 0
+            finally:
+                db.session.remove()
+
+            if not attempted:
+                time.sleep(POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    run_resolver()
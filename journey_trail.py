@@ -0,0 +1,221 @@
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from database import db
+from models import Journey, JourneyTrailSegment
+from postcode_service import PostcodeService
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on fixes accepted in a single /journey/points request
+MAX_TRAIL_POINTS = 1000
+
+# Fixes less accurate than this (iOS horizontalAccuracy, metres) are dropped
+MAX_ACCURACY_METRES = 50.0
+
+# Fixes closer than this to the last kept one are GPS jitter, not movement (~10 m)
+MIN_STEP_MILES = 0.006
+
+# Steps faster than this are treated as position glitches
+MAX_SPEED_MPH = 150.0
+
+# Encoded polylines store coordinates to 5 decimal places (about 1 m)
+POLYLINE_PRECISION = 1e5
+
+
+class TrailFormatError(ValueError):
+    """Raised when a batch of fixes cannot be parsed as a whole."""
+
+
+class Fix(NamedTuple):
+    latitude: float
+    longitude: float
+    recorded_at: datetime
+    accuracy: Optional[float]
+
+
+def encode_polyline(points: List[Tuple[float, float]]) -> str:
+    """
+    Encode coordinates with the Google polyline algorithm.
+
+    Each point is stored as the difference from the previous one, so a trail
+    of nearby fixes costs a few bytes per point instead of two floats.
+    """
+    chunks = []
+    previous_lat = previous_lon = 0
+    for latitude, longitude in points:
+        lat = int(round(latitude * POLYLINE_PRECISION))
+        lon = int(round(longitude * POLYLINE_PRECISION))
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded: str) -> List[Tuple[float, float]]:
+    """Decode a Google encoded polyline back to (latitude, longitude) pairs."""
+    points = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / POLYLINE_PRECISION, lon / POLYLINE_PRECISION))
+    return points
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """ISO 8601 string or Unix seconds, as naive UTC."""
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (ValueError, OverflowError, OSError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_fixes(data: Any) -> Tuple[List[Fix], int]:
+    """
+    Parse a batch of fixes from a request body.
+
+    Args:
+        data: A list of fixes or an object with a 'points' list. Each fix has
+            latitude, longitude and timestamp (ISO 8601 or Unix seconds), and
+            optionally accuracy in metres
+
+    Returns:
+        Tuple of (valid fixes in time order, number of malformed fixes skipped)
+    """
+    if isinstance(data, dict):
+        data = data.get('points')
+    if not isinstance(data, list) or not data:
+        raise TrailFormatError("Expected a non-empty 'points' list")
+    if len(data) > MAX_TRAIL_POINTS:
+        raise TrailFormatError(f'Too many points ({len(data)}); the maximum per request is {MAX_TRAIL_POINTS}')
+
+    fixes = []
+    for point in data:
+        try:
+            latitude = float(point['latitude'])
+            longitude = float(point['longitude'])
+            accuracy = point.get('accuracy')
+            accuracy = float(accuracy) if accuracy is not None else None
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        # NaN compares false with everything, so it would slip past the accuracy filter
+        if accuracy is not None and not math.isfinite(accuracy):
+            continue
+        recorded_at = _parse_timestamp(point.get('timestamp'))
+        if recorded_at is None or not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+            continue
+        fixes.append(Fix(latitude, longitude, recorded_at, accuracy))
+
+    fixes.sort(key=lambda fix: fix.recorded_at)
+    return fixes, len(data) - len(fixes)
+
+
+def append_fixes(journey: Journey, fixes: List[Fix]) -> Dict[str, Any]:
+    """
+    Add a batch of fixes to a journey's trail.
+
+    The kept fixes are written as a single JourneyTrailSegment row, and the
+    journey's running distance and last position are advanced, so ending the
+    journey never has to read the trail back. The first batch is measured
+    from the journey's start coordinates. Fixes that are inaccurate, no
+    newer than the last kept fix (e.g. a retried batch), within jitter of it,
+    or implausibly fast are dropped. The caller commits, holding a lock on
+    the journey row so concurrent batches are applied one at a time.
+
+    Returns:
+        Dict with the number of fixes accepted and dropped, and the segment
+        added (None if nothing was kept)
+    """
+    if journey.trail_point_count:
+        last_lat, last_lon = journey.trail_last_latitude, journey.trail_last_longitude
+        last_time = journey.trail_last_recorded_at
+    else:
+        # The first batch is measured from where the journey started. The
+        # start time is server time, so it isn't compared with phone clocks
+        last_lat, last_lon, last_time = journey.start_latitude, journey.start_longitude, None
+    has_last = last_lat is not None and last_lon is not None
+
+    kept = []
+    distance = 0.0
+    for fix in fixes:
+        if fix.accuracy is not None and (fix.accuracy < 0 or fix.accuracy > MAX_ACCURACY_METRES):
+            continue
+        if last_time is not None and fix.recorded_at <= last_time:
+            continue
+        if has_last:
+            step = PostcodeService.haversine_miles(last_lat, last_lon, fix.latitude, fix.longitude)
+            if step < MIN_STEP_MILES:
+                continue
+            if last_time is not None and step > MAX_SPEED_MPH * (fix.recorded_at - last_time).total_seconds() / 3600:
+                continue
+            distance += step
+        kept.append(fix)
+        last_lat, last_lon, last_time = fix.latitude, fix.longitude, fix.recorded_at
+        has_last = True
+
+    if not kept:
+        return {'accepted': 0, 'dropped': len(fixes), 'segment': None}
+
+    segment = JourneyTrailSegment(
+        journey_id=journey.id,
+        polyline=encode_polyline([(fix.latitude, fix.longitude) for fix in kept]),
+        point_count=len(kept),
+        distance_miles=distance,
+        first_recorded_at=kept[0].recorded_at,
+        last_recorded_at=kept[-1].recorded_at
+    )
+    db.session.add(segment)
+
+    journey.trail_point_count = (journey.trail_point_count or 0) + len(kept)
+    journey.trail_distance_miles = (journey.trail_distance_miles or 0.0) + distance
+    journey.trail_last_latitude = last_lat
+    journey.trail_last_longitude = last_lon
+    journey.trail_last_recorded_at = last_time
+
+    return {'accepted': len(kept), 'dropped': len(fixes) - len(kept), 'segment': segment}
+
+
+def trail_distance(journey: Journey, latitude: float, longitude: float) -> Optional[float]:
+    """Trail mileage for a journey ending at (latitude, longitude), or None if it has no trail."""
+    if not journey.trail_point_count or journey.trail_last_latitude is None:
+        return None
+    final_step = PostcodeService.haversine_miles(
+        journey.trail_last_latitude, journey.trail_last_longitude, latitude, longitude
+    )
+    return round((journey.trail_distance_miles or 0.0) + final_step, 2)
+
+
+def get_trail_points(journey_id: int) -> List[Tuple[float, float]]:
+    """All stored trail points of a journey, in the order they were recorded."""
+    polylines = db.session.execute(
+        db.select(JourneyTrailSegment.polyline)
+        .where(JourneyTrailSegment.journey_id == journey_id)
+        .order_by(JourneyTrailSegment.id)
+    ).scalars()
+    points = []
+    for polyline in polylines:
+        points.extend(decode_polyline(polyline))
+    return points
@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Tuple
+from flask import g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from db_metrics import get_db_stats
+
+# Under gunicorn every worker writes its samples to files in
+# PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) and /metrics adds them
+# up, so a scrape sees the totals for all workers whichever one answers it.
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Responses sent, by route and status code',
+    ['method', 'route', 'status']
+)
+DB_QUERIES = Counter(
+    'db_queries_total', 'Database queries run while handling requests, by route',
+    ['route']
+)
+DB_TIME = Counter(
+    'db_query_seconds_total', 'Time spent in database queries while handling requests, by route',
+    ['route']
+)
+UPSTREAM_LATENCY = Histogram(
+    'postcode_upstream_request_duration_seconds', 'postcodes.io call latency, by upstream and outcome',
+    ['upstream', 'outcome'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
+UPSTREAM_RETRIES = Counter(
+    'postcode_upstream_retries_total', 'postcodes.io calls retried after a failed attempt',
+    ['upstream']
+)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups, by cache and hit or miss',
+    ['cache', 'result']
+)
+
+
+def observe_upstream_request(upstream: str, outcome: str, seconds: float) -> None:
+    """Record one postcodes.io call ('primary' or 'backup') and how it ended."""
+    UPSTREAM_LATENCY.labels(upstream, outcome).observe(seconds)
+
+
+def record_upstream_retry(upstream: str) -> None:
+    UPSTREAM_RETRIES.labels(upstream).inc()
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """Count a cache lookup; the hit ratio is hits / (hits + misses) per cache."""
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Metrics in the Prometheus text format, with the content type to serve them as."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app):
+    """
+    Record latency, status and DB usage for every request.
+
+    Routes are labelled by their URL rule (e.g. /LocationApp/api/journeys/<int:journey_id>)
+    rather than the raw path, so label values stay bounded. Streamed responses
+    are timed up to the point the response starts.
+    """
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - started)
+        REQUEST_COUNT.labels(request.method, route, str(response.status_code)).inc()
+
+        query_count, db_time_ms = get_db_stats()
+        if query_count:
+            DB_QUERIES.labels(route).inc(query_count)
+            DB_TIME.labels(route).inc(db_time_ms / 1000)
+        return response
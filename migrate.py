@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Versioned database migrations.
+
+Each migration has a version number. Applied versions are recorded in the
+schema_version table, so running this script again only applies what is
+new. Migrations are written to run against a live database:
+
+- every DDL statement runs in its own short transaction under a lock
+  timeout, so a blocked ALTER TABLE gives up instead of queueing journey
+  traffic behind it
+- indexes are built with CREATE INDEX CONCURRENTLY on PostgreSQL
+- data backfills update MIGRATION_BATCH_SIZE rows per transaction and sleep
+  MIGRATION_THROTTLE_SECONDS between batches
+
+Every step checks the current schema first, so an interrupted run can
+simply be started again.
+
+Run with:
+    python migrate.py [--batch-size 1000] [--throttle 0.1] [--status]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from models import ExportJob, IdempotencyKey, JourneyTrailSegment, SchemaVersion
+from spatial import encode_geohash
+
+logger = logging.getLogger(__name__)
+
+# Rows updated per backfill transaction
+DEFAULT_BATCH_SIZE = 1000
+
+# Seconds to pause between backfill batches, giving other queries room
+DEFAULT_THROTTLE = 0.1
+
+# How long a DDL statement may wait for its table lock before giving up (ms)
+LOCK_TIMEOUT_MS = 5000
+
+# Attempts for a DDL statement that times out waiting for its lock
+LOCK_RETRIES = 5
+
+
+class MigrationContext:
+    """Schema helpers handed to each migration."""
+
+    def __init__(self, engine: Engine, batch_size: int = DEFAULT_BATCH_SIZE, throttle: float = DEFAULT_THROTTLE):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.is_postgres = engine.dialect.name == 'postgresql'
+
+    def columns(self, table: str) -> Set[str]:
+        """Names of the columns a table currently has."""
+        return {column['name'] for column in inspect(self.engine).get_columns(table)}
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.engine).has_table(table)
+
+    def execute_ddl(self, statement: str) -> None:
+        """Run one DDL statement in its own transaction, retrying if its lock wait times out."""
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                with self.engine.begin() as connection:
+                    if self.is_postgres:
+                        connection.execute(text(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}"))
+                    connection.execute(text(statement))
+                return
+            except OperationalError as e:
+                if attempt == LOCK_RETRIES or 'lock timeout' not in str(e).lower():
+                    raise
+                logger.warning(f"Lock wait timed out (attempt {attempt}/{LOCK_RETRIES}), retrying: {statement}")
+                time.sleep(attempt)
+
+    def add_column(self, table: str, column: str, definition: str) -> None:
+        """Add a column unless it already exists. Keep definitions nullable or with a constant default."""
+        if column in self.columns(table):
+            logger.info(f"Column '{table}.{column}' already exists")
+            return
+        logger.info(f"Adding column '{table}.{column}'...")
+        self.execute_ddl(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def drop_column(self, table: str, column: str) -> None:
+        """Drop a column if it exists."""
+        if column not in self.columns(table):
+            logger.info(f"Column '{table}.{column}' already removed")
+            return
+        logger.info(f"Dropping column '{table}.{column}'...")
+        self.execute_ddl(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    def create_index(self, name: str, table: str, columns: List[str]) -> None:
+        """
+        Create an index without blocking writes to the table.
+
+        On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY, which
+        cannot run inside a transaction. A concurrent build that failed part
+        way leaves an INVALID index behind; that is dropped and rebuilt.
+        """
+        column_list = ', '.join(columns)
+        if not self.is_postgres:
+            self.execute_ddl(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})")
+            return
+
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text("SET statement_timeout = 0"))
+            valid = connection.execute(text("""
+                SELECT i.indisvalid
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name
+            """), {'name': name}).scalar()
+
+            if valid:
+                logger.info(f"Index '{name}' already exists")
+                return
+            if valid is False:
+                logger.warning(f"Dropping invalid index '{name}' left by an interrupted build")
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            logger.info(f"Building index '{name}' on {table} ({column_list}) concurrently...")
+            connection.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {table} ({column_list})"))
+
+    def backfill(self, table: str, assignments: str, condition: str) -> int:
+        """
+        UPDATE table SET assignments WHERE condition, batch_size rows at a time.
+
+        Rows are walked in primary key order and each batch commits on its own,
+        so row locks are held briefly and the backfill can be interrupted and
+        resumed. Returns the number of rows updated.
+        """
+        statement = text(f"""
+            UPDATE {table} SET {assignments}
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE id > :after AND ({condition})
+                ORDER BY id
+                LIMIT :batch_size
+            )
+            RETURNING id
+        """)
+
+        updated = 0
+        after = 0
+        while True:
+            with self.engine.begin() as connection:
+                ids = connection.execute(statement, {'after': after, 'batch_size': self.batch_size}).scalars().all()
+            if not ids:
+                break
+            updated += len(ids)
+            after = max(ids)
+            logger.info(f"Backfilled {updated} row(s) in '{table}'")
+            if self.throttle:
+                time.sleep(self.throttle)
+        return updated
+
+    def backfill_computed(self, table: str, columns: List[str], condition: str,
+                          compute: Callable[[Any], Dict[str, Any]]) -> int:
+        """
+        Like backfill, for values computed in Python from each row.
+
+        Selects id and columns for batch_size rows matching condition, in
+        primary key order, and writes compute(row) back to each one, one
+        transaction per batch. Returns the number of rows updated.
+        """
+        select = text(f"""
+            SELECT id, {', '.join(columns)} FROM {table}
+            WHERE id > :after AND ({condition})
+            ORDER BY id
+            LIMIT :batch_size
+        """)
+
+        updated = 0
+        after = 0
+        while True:
+            with self.engine.begin() as connection:
+                rows = connection.execute(select, {'after': after, 'batch_size': self.batch_size}).all()
+                if not rows:
+                    break
+                values = [{'row_id': row.id, **compute(row)} for row in rows]
+                assignments = ', '.join(f"{name} = :{name}" for name in values[0] if name != 'row_id')
+                connection.execute(text(f"UPDATE {table} SET {assignments} WHERE id = :row_id"), values)
+            updated += len(rows)
+            after = rows[-1].id
+            logger.info(f"Backfilled {updated} row(s) in '{table}'")
+            if self.throttle:
+                time.sleep(self.throttle)
+        return updated
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[MigrationContext], None]
+
+
+def journey_client_fields(context: MigrationContext) -> None:
+    # Replaces add_label_column.py and update_journey_fields.py
+    context.add_column('journeys', 'client_name', 'VARCHAR(100)')
+    context.add_column('journeys', 'recharge_to_client', 'BOOLEAN')
+    context.add_column('journeys', 'description', 'TEXT')
+    if 'label' in context.columns('journeys'):
+        # Keep old labels rather than losing them with the column
+        context.backfill('journeys', 'description = label', 'label IS NOT NULL AND description IS NULL')
+        context.drop_column('journeys', 'label')
+
+
+def journey_resolution_columns(context: MigrationContext) -> None:
+    # Replaces add_journey_resolution_columns.py
+    context.add_column('journeys', 'resolution_status', 'VARCHAR(20)')
+    context.add_column('journeys', 'resolution_attempts', 'INTEGER NOT NULL DEFAULT 0')
+    context.add_column('journeys', 'next_resolution_at', 'TIMESTAMP')
+    context.create_index('ix_journeys_resolution_status', 'journeys', ['resolution_status'])
+
+
+def export_jobs_table(context: MigrationContext) -> None:
+    if context.has_table('export_jobs'):
+        logger.info("Table 'export_jobs' already exists")
+        return
+    logger.info("Creating table 'export_jobs'...")
+    ExportJob.__table__.create(context.engine, checkfirst=True)
+
+
+def journey_user_start_time_index(context: MigrationContext) -> None:
+    # Journey lists, exports and summaries all filter by user and sort by start time
+    context.create_index('ix_journeys_user_id_start_time', 'journeys', ['user_id', 'start_time'])
+
+
+def journey_trails(context: MigrationContext) -> None:
+    context.add_column('journeys', 'trail_point_count', 'INTEGER NOT NULL DEFAULT 0')
+    context.add_column('journeys', 'trail_distance_miles', 'FLOAT')
+    context.add_column('journeys', 'trail_last_latitude', 'FLOAT')
+    context.add_column('journeys', 'trail_last_longitude', 'FLOAT')
+    context.add_column('journeys', 'trail_last_recorded_at', 'TIMESTAMP')
+    if context.has_table('journey_trail_segments'):
+        logger.info("Table 'journey_trail_segments' already exists")
+        return
+    logger.info("Creating table 'journey_trail_segments'...")
+    JourneyTrailSegment.__table__.create(context.engine, checkfirst=True)
+
+
+def journey_position_indexes(context: MigrationContext) -> None:
+    # Map clustering selects a user's journeys by latitude/longitude range
+    for kind in ('start', 'end'):
+        context.create_index(f'ix_journeys_user_id_{kind}_position', 'journeys',
+                             ['user_id', f'{kind}_latitude', f'{kind}_longitude'])
+
+
+def _journey_geohashes(row) -> Dict[str, Any]:
+    return {
+        'start_geohash': encode_geohash(row.start_latitude, row.start_longitude)
+        if row.start_latitude is not None and row.start_longitude is not None else None,
+        'end_geohash': encode_geohash(row.end_latitude, row.end_longitude)
+        if row.end_latitude is not None and row.end_longitude is not None else None
+    }
+
+
+def journey_geohashes(context: MigrationContext) -> None:
+    context.add_column('journeys', 'start_geohash', 'VARCHAR(12)')
+    context.add_column('journeys', 'end_geohash', 'VARCHAR(12)')
+    context.backfill_computed(
+        'journeys', ['start_latitude', 'start_longitude', 'end_latitude', 'end_longitude'],
+        '(start_geohash IS NULL AND start_latitude IS NOT NULL AND start_longitude IS NOT NULL) OR '
+        '(end_geohash IS NULL AND end_latitude IS NOT NULL AND end_longitude IS NOT NULL)',
+        _journey_geohashes
+    )
+    for kind in ('start', 'end'):
+        context.create_index(f'ix_journeys_user_id_{kind}_geohash', 'journeys', ['user_id', f'{kind}_geohash'])
+
+
+def journey_approximate_postcodes(context: MigrationContext) -> None:
+    context.add_column('journeys', 'start_postcode_approximate', 'BOOLEAN')
+    context.add_column('journeys', 'end_postcode_approximate', 'BOOLEAN')
+
+
+def idempotency_keys_table(context: MigrationContext) -> None:
+    if context.has_table('idempotency_keys'):
+        logger.info("Table 'idempotency_keys' already exists")
+        return
+    logger.info("Creating table 'idempotency_keys'...")
+    IdempotencyKey.__table__.create(context.engine, checkfirst=True)
+
+
+def export_job_heartbeats(context: MigrationContext) -> None:
+    context.add_column('export_jobs', 'heartbeat_at', 'TIMESTAMP')
+    context.backfill('export_jobs', 'heartbeat_at = started_at', "status = 'running' AND heartbeat_at IS NULL")
+
+
+MIGRATIONS = [
+    Migration(1, 'Journey client name, recharge and description fields', journey_client_fields),
+    Migration(2, 'Deferred journey resolution columns', journey_resolution_columns),
+    Migration(3, 'Background export jobs table', export_jobs_table),
+    Migration(4, 'Index journeys by user and start time', journey_user_start_time_index),
+    Migration(5, 'GPS trail totals and segments table', journey_trails),
+    Migration(6, 'Index journeys by user and start/end position', journey_position_indexes),
+    Migration(7, 'Indexed geohashes of journey start/end positions', journey_geohashes),
+    Migration(8, 'Flags for postcodes guessed from journey history', journey_approximate_postcodes),
+    Migration(9, 'Idempotency keys table', idempotency_keys_table),
+    Migration(10, 'Progress heartbeat for running export jobs', export_job_heartbeats),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(engine: Engine) -> int:
+    """Highest recorded version; a database created from the models starts at LATEST_VERSION."""
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def run_migrations(database_uri: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                   throttle: float = DEFAULT_THROTTLE, target: Optional[int] = None) -> List[int]:
+    """
+    Apply every migration newer than the version recorded in schema_version, in order.
+
+    Args:
+        database_uri: Database to migrate
+        batch_size: Rows updated per backfill transaction
+        throttle: Seconds to sleep between backfill batches
+        target: Stop after this version (default: apply all)
+
+    Returns:
+        List[int]: The versions applied by this run
+    """
+    # A dedicated engine: the app's statement_timeout must not cut index builds short
+    engine = create_engine(database_uri)
+    context = MigrationContext(engine, batch_size, throttle)
+
+    try:
+        current = current_version(engine)
+        applied = []
+        for migration in MIGRATIONS:
+            if migration.version <= current or (target is not None and migration.version > target):
+                continue
+            logger.info(f"Applying migration {migration.version}: {migration.description}")
+            started = time.monotonic()
+            migration.upgrade(context)
+            with engine.begin() as connection:
+                connection.execute(
+                    SchemaVersion.__table__.insert().values(
+                        version=migration.version, description=migration.description, applied_at=datetime.utcnow()
+                    )
+                )
+            logger.info(f"Migration {migration.version} applied in {time.monotonic() - started:.1f}s")
+            applied.append(migration.version)
+        return applied
+    finally:
+        engine.dispose()
+
+
+def print_status(database_uri: str) -> None:
+    engine = create_engine(database_uri)
+    try:
+        current = current_version(engine)
+    finally:
+        engine.dispose()
+    for migration in MIGRATIONS:
+        state = 'applied' if migration.version <= current else 'pending'
+        print(f"{migration.version:>4}  {state:<8} {migration.description}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Apply database migrations')
+    parser.add_argument('--batch-size', type=int,
+                        default=int(os.environ.get('MIGRATION_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                        help='Rows per backfill transaction')
+    parser.add_argument('--throttle', type=float,
+                        default=float(os.environ.get('MIGRATION_THROTTLE_SECONDS', DEFAULT_THROTTLE)),
+                        help='Seconds to sleep between backfill batches')
+    parser.add_argument('--target', type=int, help='Stop after this migration version')
+    parser.add_argument('--status', action='store_true', help='List migrations and exit')
+    args = parser.parse_args()
+
+    from app import app
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+
+    if args.status:
+        print_status(database_uri)
+        return
+
+    try:
+        applied = run_migrations(database_uri, args.batch_size, args.throttle, args.target)
+    except Exception as e:
+        logger.error(f"❌ Migration failed: {e}")
+        print("❌ Database migration failed! Fix the problem and run it again; finished steps are skipped.")
+        sys.exit(1)
+
+    if applied:
+        print(f"✅ Applied migration(s): {', '.join(str(version) for version in applied)}")
+    else:
+        print("✅ Database is already up to date")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from datetime import datetime
 from database import db
+from sqlalchemy.orm import object_session
+from journey_events import journey_changed
+from spatial import encode_geohash
 from typing import Dict, Any
 
 class Journey(db.Model):
@@ -26,6 +29,34 @@ class Journey(db.Model):
     end_latitude = db.Column(db.Float, nullable=True) 
     end_longitude = db.Column(db.Float, nullable=True)
     
+    # Postcodes guessed from the user's history while postcodes.io was unavailable
+    start_postcode_approximate = db.Column(db.Boolean, nullable=True)
+    end_postcode_approximate = db.Column(db.Boolean, nullable=True)
+    
+    # Geohashes of the coordinates for "near a site" queries, set on save (see _set_geohashes)
+    start_geohash = db.Column(db.String(12), nullable=True)
+    end_geohash = db.Column(db.String(12), nullable=True)
+    
+    # Deferred completion: end postcode and distance filled in by journey_resolver
+    resolution_status = db.Column(db.String(20), nullable=True, index=True)  # None, pending, resolved, failed
+    resolution_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_resolution_at = db.Column(db.DateTime, nullable=True)
+    
+    # GPS trail running totals, kept up to date by journey_trail.append_fixes
+    trail_point_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    trail_distance_miles = db.Column(db.Float, nullable=True)
+    trail_last_latitude = db.Column(db.Float, nullable=True)
+    trail_last_longitude = db.Column(db.Float, nullable=True)
+    trail_last_recorded_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_journeys_user_id_start_time', 'user_id', 'start_time'),
+        db.Index('ix_journeys_user_id_start_position', 'user_id', 'start_latitude', 'start_longitude'),
+        db.Index('ix_journeys_user_id_end_position', 'user_id', 'end_latitude', 'end_longitude'),
+        db.Index('ix_journeys_user_id_start_geohash', 'user_id', 'start_geohash'),
+        db.Index('ix_journeys_user_id_end_geohash', 'user_id', 'end_geohash'),
+    )
+    
     def __repr__(self) -> str:
         return f'<Journey {self.id}: {self.start_postcode} to {self.end_postcode}>'
     
@@ -35,6 +66,8 @@ class Journey(db.Model):
             'id': self.id,
             'start_postcode': self.start_postcode,
             'end_postcode': self.end_postcode,
+            'start_postcode_approximate': bool(self.start_postcode_approximate),
+            'end_postcode_approximate': bool(self.end_postcode_approximate),
             'start_time': self.start_time.isoformat() if self.start_time else None,
             'end_time': self.end_time.isoformat() if self.end_time else None,
             'distance_miles': self.distance_miles,
@@ -46,9 +79,48 @@ class Journey(db.Model):
             'start_latitude': self.start_latitude,
             'start_longitude': self.start_longitude,
             'end_latitude': self.end_latitude,
-            'end_longitude': self.end_longitude
+            'end_longitude': self.end_longitude,
+            'resolution_status': self.resolution_status,
+            'trail_point_count': self.trail_point_count or 0
         }
 
+@db.event.listens_for(Journey, 'before_insert')
+@db.event.listens_for(Journey, 'before_update')
+def _set_geohashes(mapper, connection, journey: Journey) -> None:
+    """Keep the geohash columns in step with the coordinates whenever a journey is saved."""
+    journey.start_geohash = (
+        encode_geohash(journey.start_latitude, journey.start_longitude)
+        if journey.start_latitude is not None and journey.start_longitude is not None else None
+    )
+    journey.end_geohash = (
+        encode_geohash(journey.end_latitude, journey.end_longitude)
+        if journey.end_latitude is not None and journey.end_longitude is not None else None
+    )
+
+@db.event.listens_for(Journey, 'after_insert')
+@db.event.listens_for(Journey, 'after_update')
+@db.event.listens_for(Journey, 'after_delete')
+def _notify_journey_changed(mapper, connection, journey: Journey) -> None:
+    """Wake the owner's active journey streams once this write commits."""
+    journey_changed(connection, object_session(journey), journey.user_id)
+
+class JourneyTrailSegment(db.Model):
+    """Model for one batch of GPS fixes on a journey, stored as an encoded polyline."""
+    
+    __tablename__ = 'journey_trail_segments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    journey_id = db.Column(db.Integer, db.ForeignKey('journeys.id', ondelete='CASCADE'), nullable=False, index=True)
+    polyline = db.Column(db.Text, nullable=False)  # Google encoded polyline, 5 decimal places
+    point_count = db.Column(db.Integer, nullable=False)
+    distance_miles = db.Column(db.Float, nullable=False)  # Includes the step from the previous segment
+    first_recorded_at = db.Column(db.DateTime, nullable=False)
+    last_recorded_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self) -> str:
+        return f'<JourneyTrailSegment {self.id}: journey {self.journey_id}, {self.point_count} points>'
+
 class User(db.Model):
     """Model for user authentication and management."""
     
@@ -72,3 +144,82 @@ class User(db.Model):
             'username': self.username,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+class ExportJob(db.Model):
+    """Model for background export jobs, which also serves as the worker queue."""
+    
+    __tablename__ = 'export_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    format = db.Column(db.String(10), nullable=False)  # 'csv' or 'xlsx'
+    filters = db.Column(db.Text, nullable=True)  # JSON of the export query arguments
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    rows_total = db.Column(db.Integer, nullable=True)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    file_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Last progress from the worker running the job
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self) -> str:
+        return f'<ExportJob {self.id}: {self.format} {self.status}>'
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert export job to a dictionary for JSON serialization."""
+        progress = None
+        if self.status == 'completed':
+            progress = 100.0
+        elif self.rows_total:
+            progress = round(min(self.rows_written / self.rows_total, 1.0) * 100, 1)
+        
+        return {
+            'id': self.id,
+            'format': self.format,
+            'status': self.status,
+            'rows_total': self.rows_total,
+            'rows_written': self.rows_written,
+            'progress_percent': progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+class IdempotencyKey(db.Model):
+    """Model storing the first response to a request sent with an Idempotency-Key header."""
+    
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of the method, path and body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, committed, completed
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_id_key'),
+    )
+    
+    def __repr__(self) -> str:
+        return f'<IdempotencyKey {self.id}: user {self.user_id} {self.status}>'
+
+class SchemaVersion(db.Model):
+    """Model recording the migrations applied to the database (see migrate.py)."""
+    
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self) -> str:
+        return f'<SchemaVersion {self.version}>'
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Postcode autocomplete without upstream calls.
+
+Suggestions come from two places:
+
+- a sorted list of UK postcodes, built once from a postcode CSV (e.g. the
+  ONS Postcode Directory or any file with the postcode in its first column)
+  into a fixed-width binary file that the app memory-maps, so startup stays
+  instant and every worker shares the same pages
+- each user's most used journey postcodes, cached in memory for a few minutes
+
+Build the index file with:
+    python postcode_index.py build ONSPD.csv data/postcodes.idx
+"""
+
+import argparse
+import csv
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Optional, Tuple
+from database import db
+from metrics import record_cache_lookup
+from models import Journey
+from postcode_service import PostcodeService
+
+logger = logging.getLogger(__name__)
+
+# Index file layout: an 8 byte header, then one 8 byte record per postcode
+# ('AB10 1AA', shorter ones padded with NUL bytes), in sorted order
+INDEX_MAGIC = b'PCIDX\x00\x01\x08'
+RECORD_SIZE = 8
+
+# Frequent postcodes kept per user, and how long they are cached
+USER_POSTCODES_LIMIT = 200
+USER_POSTCODES_TTL = 300
+
+# Users whose frequent postcodes are cached per process
+MAX_CACHED_USERS = 1000
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+
+def format_postcode(postcode: str) -> Optional[str]:
+    """Canonical 'OUTWARD INWARD' form of a postcode, or None if it isn't a valid UK postcode."""
+    if not postcode:
+        return None
+    compact = ''.join(postcode.split()).upper()
+    if not PostcodeService.validate_postcode(compact):
+        return None
+    return f'{compact[:-3]} {compact[-3:]}'
+
+
+def query_prefixes(query: str) -> List[str]:
+    """
+    Canonical prefixes to search for a typed query.
+
+    'AB10 1' is unambiguous. Without a space, 'AB101' is searched as
+    'AB10 1' and 'AB1 01' (and a short query as an outward code prefix too),
+    since users often leave the space out.
+    """
+    words = query.upper().split()
+    if not words:
+        return []
+    if len(words) > 1:
+        return [' '.join(words[:2])]
+    compact = words[0]
+    prefixes = [compact] if len(compact) <= 4 else []
+    for split in range(len(compact) - 1, max(1, len(compact) - 4), -1):
+        # The outward code contains a digit and the inward code starts with one
+        if compact[split].isdigit() and any(char.isdigit() for char in compact[:split]):
+            prefixes.append(f'{compact[:split]} {compact[split:]}')
+    return prefixes
+
+
+class PostcodeIndex:
+    """Prefix search over a memory-mapped index file built by build_index_file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self._data = None
+        self.count = 0
+        if path:
+            self.open(path)
+
+    def open(self, path: str) -> None:
+        with open(path, 'rb') as source:
+            data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:RECORD_SIZE] != INDEX_MAGIC or len(data) % RECORD_SIZE:
+            data.close()
+            raise ValueError(f'{path} is not a postcode index file')
+        self._data = data
+        self.count = len(data) // RECORD_SIZE - 1
+        logger.info(f"Loaded postcode index {path} ({self.count} postcodes)")
+
+    def _record(self, position: int) -> bytes:
+        start = (position + 1) * RECORD_SIZE
+        return self._data[start:start + RECORD_SIZE]
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """Up to limit postcodes starting with a canonical prefix, in order."""
+        if self._data is None or not prefix:
+            return []
+        key = prefix.encode('ascii', 'ignore')
+
+        # Binary search for the first record >= prefix
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        matches = []
+        while low < self.count and len(matches) < limit:
+            record = self._record(low)
+            if not record.startswith(key):
+                break
+            matches.append(record.rstrip(b'\x00').decode('ascii'))
+            low += 1
+        return matches
+
+
+def _read_postcodes(path: str) -> Iterable[str]:
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        for row in csv.reader(source):
+            if row:
+                postcode = format_postcode(row[0])
+                if postcode:
+                    yield postcode
+
+
+def build_index_file(source_path: str, index_path: str) -> int:
+    """Write the sorted, de-duplicated postcodes of a CSV to an index file. Returns the count."""
+    postcodes = sorted(set(_read_postcodes(source_path)))
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f'{index_path}.tmp'
+    with open(temporary_path, 'wb') as target:
+        target.write(INDEX_MAGIC)
+        for postcode in postcodes:
+            target.write(postcode.encode('ascii').ljust(RECORD_SIZE, b'\x00'))
+    os.replace(temporary_path, index_path)
+    return len(postcodes)
+
+
+class UserPostcodes:
+    """Each user's most used journey postcodes, refreshed every USER_POSTCODES_TTL seconds."""
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS, ttl: float = USER_POSTCODES_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._cache: 'OrderedDict[int, Tuple[float, List[Tuple[str, int]]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id: int) -> List[Tuple[str, int]]:
+        uses = Counter()
+        for column in (Journey.start_postcode, Journey.end_postcode):
+            rows = db.session.execute(
+                db.select(column, db.func.count())
+                .where(Journey.user_id == user_id, column.isnot(None))
+                .group_by(column)
+            )
+            for postcode, count in rows:
+                postcode = format_postcode(postcode)
+                if postcode:
+                    uses[postcode] += count
+        return uses.most_common(USER_POSTCODES_LIMIT)
+
+    def get(self, user_id: int) -> List[Tuple[str, int]]:
+        """(postcode, uses) pairs, most used first."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(user_id)
+                record_cache_lookup('user_postcodes', True)
+                return cached[1]
+
+        record_cache_lookup('user_postcodes', False)
+        postcodes = self._load(user_id)
+        with self._lock:
+            self._cache[user_id] = (now + self.ttl, postcodes)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+        return postcodes
+
+
+postcode_index = PostcodeIndex()
+user_postcodes = UserPostcodes()
+
+
+def init_postcode_index(app) -> None:
+    """Memory-map POSTCODE_INDEX_PATH if it exists; otherwise only users' own postcodes are suggested."""
+    path = app.config.get('POSTCODE_INDEX_PATH')
+    if not path or not os.path.exists(path):
+        logger.info("No postcode index file; autocomplete suggests users' own postcodes only")
+        return
+    try:
+        postcode_index.open(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load postcode index {path}: {e}")
+
+
+def autocomplete(user_id: int, query: str, limit: int = DEFAULT_SUGGESTIONS) -> List[dict]:
+    """
+    Postcode suggestions for a partly typed postcode.
+
+    The user's own postcodes that match come first, most used first, then
+    postcodes from the index in alphabetical order.
+    """
+    prefixes = query_prefixes(query)
+    if not prefixes:
+        return []
+
+    suggestions = []
+    seen = set()
+    for postcode, uses in user_postcodes.get(user_id):
+        if len(suggestions) >= limit:
+            break
+        if any(postcode.startswith(prefix) for prefix in prefixes):
+            suggestions.append({'postcode': postcode, 'uses': uses})
+            seen.add(postcode)
+
+    for prefix in prefixes:
+        for postcode in postcode_index.complete(prefix, limit):
+            if len(suggestions) >= limit:
+                return suggestions
+            if postcode not in seen:
+                suggestions.append({'postcode': postcode, 'uses': 0})
+                seen.add(postcode)
+    return suggestions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build the postcode autocomplete index')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help='Build an index file from a postcode CSV')
+    build.add_argument('source', help='CSV with the postcode in the first column (a header row is skipped)')
+    build.add_argument('index', help='Index file to write (POSTCODE_INDEX_PATH)')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    count = build_index_file(args.source, args.index)
+    print(f"✅ Wrote {count} postcodes to {args.index} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
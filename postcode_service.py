@@ -1,9 +1,14 @@
-import requests
 import logging
 import math
+import os
+import threading
 import time
-from typing import Tuple, Optional, Dict, Any
+from typing import TYPE_CHECKING, Tuple, Optional, Dict, Any
+
+if TYPE_CHECKING:
+    import requests
 from dataclasses import dataclass
+from metrics import observe_upstream_request, record_upstream_retry
 
 logger = logging.getLogger(__name__)
 
@@ -19,47 +24,80 @@ class PostcodeInfo:
 class PostcodeService:
     """Robust service for UK postcode validation and distance calculation."""
     
-    BASE_URL = "https://api.postcodes.io"
-    BACKUP_URL = "https://postcodes.io/api"  # Fallback URL
+    BASE_URL = os.environ.get('POSTCODES_IO_URL', "https://api.postcodes.io")
+    BACKUP_URL = os.environ.get('POSTCODES_IO_BACKUP_URL', "https://postcodes.io/api")  # Fallback URL
     MAX_RETRIES = 1  # Reduced to 1 retry for faster response
     RETRY_DELAY = 0.3  # Reduced to 0.3 seconds
     REQUEST_TIMEOUT = 5  # Reduced to 5 seconds for faster timeout
+    BULK_LOOKUP_LIMIT = 100  # Maximum postcodes per bulk lookup request (postcodes.io limit)
+    
+    # requests.Session is not thread-safe, so each thread (gthread worker) gets
+    # its own; this also keeps upstream connections alive between lookups
+    _local = threading.local()
+    
+    @classmethod
+    def _get_session(cls) -> 'requests.Session':
+        """Get the HTTP session for the current thread."""
+        session = getattr(cls._local, 'session', None)
+        if session is None:
+            import requests  # Imported on first lookup to keep app startup fast
+            session = requests.Session()
+            cls._local.session = session
+        return session
     
     @classmethod
-    def _make_request(cls, url: str, max_retries: int = None) -> Optional[Dict[str, Any]]:
-        """Make a robust HTTP request with retries."""
+    def _make_request(cls, url: str, max_retries: int = None, payload: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Make a robust HTTP request with retries. Sends a JSON POST when a payload is given."""
+        import requests
+        
         if max_retries is None:
             max_retries = cls.MAX_RETRIES
+        upstream = 'backup' if url.startswith(cls.BACKUP_URL) else 'primary'
             
         for attempt in range(max_retries + 1):
+            outcome = 'error'
+            started = time.perf_counter()
             try:
                 logger.debug(f"Making request to {url} (attempt {attempt + 1})")
-                response = requests.get(url, timeout=cls.REQUEST_TIMEOUT)
+                session = cls._get_session()
+                if payload is None:
+                    response = session.get(url, timeout=cls.REQUEST_TIMEOUT)
+                else:
+                    response = session.post(url, json=payload, timeout=cls.REQUEST_TIMEOUT)
                 
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('status') == 200:
+                        outcome = 'ok'
                         return data
                     else:
+                        outcome = 'api_error'
                         logger.warning(f"API returned non-200 status: {data.get('status')}")
                         
                 elif response.status_code == 404:
+                    outcome = 'not_found'
                     logger.info(f"Resource not found (404): {url}")
                     return None
                     
                 else:
+                    outcome = 'http_error'
                     logger.warning(f"HTTP {response.status_code} from {url}")
                     
             except requests.exceptions.Timeout:
+                outcome = 'timeout'
                 logger.warning(f"Request timeout for {url} (attempt {attempt + 1})")
             except requests.exceptions.ConnectionError:
+                outcome = 'connection_error'
                 logger.warning(f"Connection error for {url} (attempt {attempt + 1})")
             except requests.exceptions.RequestException as e:
                 logger.warning(f"Request exception for {url}: {e} (attempt {attempt + 1})")
             except Exception as e:
                 logger.error(f"Unexpected error for {url}: {e} (attempt {attempt + 1})")
+            finally:
+                observe_upstream_request(upstream, outcome, time.perf_counter() - started)
             
             if attempt < max_retries:
+                record_upstream_retry(upstream)
                 time.sleep(cls.RETRY_DELAY)  # Fixed delay instead of exponential for speed
                 
         logger.error(f"All {max_retries + 1} attempts failed for {url}")
@@ -186,6 +224,56 @@ class PostcodeService:
         logger.warning(f"Postcode not found: {postcode}")
         return None
     
+    @classmethod
+    def bulk_get_postcode_info(cls, postcodes: list) -> Dict[str, Optional[PostcodeInfo]]:
+        """
+        Get detailed information for many postcodes using batched bulk lookups.
+        
+        Distinct postcodes are resolved in requests of up to BULK_LOOKUP_LIMIT,
+        so N postcodes cost roughly N / 100 upstream calls instead of N.
+        
+        Args:
+            postcodes: List of postcodes to look up
+            
+        Returns:
+            Dict[str, Optional[PostcodeInfo]]: Mapping of each input postcode to its
+            information, or None if it is invalid or was not found
+        """
+        normalized = {
+            postcode: postcode.strip().upper().replace(' ', '')
+            for postcode in postcodes
+            if cls.validate_postcode(postcode)
+        }
+        unique_postcodes = list(dict.fromkeys(normalized.values()))
+        found = {}
+        
+        for start in range(0, len(unique_postcodes), cls.BULK_LOOKUP_LIMIT):
+            batch = unique_postcodes[start:start + cls.BULK_LOOKUP_LIMIT]
+            payload = {'postcodes': batch}
+            
+            data = cls._make_request(f"{cls.BASE_URL}/postcodes", payload=payload)
+            if not data or not data.get('result'):
+                logger.info(f"Primary bulk lookup failed, trying backup for {len(batch)} postcodes")
+                data = cls._make_request(f"{cls.BACKUP_URL}/postcodes", payload=payload)
+            
+            if not data or not data.get('result'):
+                logger.warning(f"Bulk lookup failed for {len(batch)} postcodes")
+                continue
+            
+            for item in data['result']:
+                result = item.get('result')
+                if result and item.get('query'):
+                    found[item['query'].strip().upper().replace(' ', '')] = PostcodeInfo(
+                        postcode=result['postcode'],
+                        latitude=result['latitude'],
+                        longitude=result['longitude'],
+                        region=result.get('region'),
+                        district=result.get('admin_district')
+                    )
+        
+        logger.info(f"Bulk lookup resolved {len(found)} of {len(unique_postcodes)} distinct postcodes")
+        return {postcode: found.get(normalized.get(postcode)) for postcode in postcodes}
+    
     @classmethod
     def calculate_distance(cls, postcode1: str, postcode2: str) -> Optional[float]:
         """
@@ -223,6 +311,20 @@ class PostcodeService:
         """
         Calculate distance in miles between two coordinate points using Haversine formula.
         
+        Args:
+            lat1, lon1: First coordinate point
+            lat2, lon2: Second coordinate point
+            
+        Returns:
+            float: Distance in miles, rounded to 2 decimal places
+        """
+        return round(PostcodeService.haversine_miles(lat1, lon1, lat2, lon2), 2)
+    
+    @staticmethod
+    def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """
+        Unrounded Haversine distance in miles, for summing many short steps (e.g. a GPS trail).
+        
         Args:
             lat1, lon1: First coordinate point
             lat2, lon2: Second coordinate point
@@ -248,8 +350,7 @@ class PostcodeService:
              math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2)
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         
-        distance = R * c
-        return round(distance, 2)
+        return R * c
     
     @classmethod
     def bulk_validate_postcodes(cls, postcodes: list) -> Dict[str, bool]:
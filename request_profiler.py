@@ -0,0 +1,145 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds between stack samples for the collapsed (flamegraph) output
+SAMPLE_INTERVAL_MS = 5
+
+# Functions listed in the text summary, by cumulative time
+SUMMARY_LINES = 40
+
+# cProfile can only profile one request per process at a time
+_profile_lock = threading.Lock()
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='request-profiler-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _profile_requested(token: str) -> bool:
+    supplied = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(supplied) and hmac.compare_digest(supplied, token)
+
+
+def _report_name() -> str:
+    route = request.url_rule.rule if request.url_rule else request.path
+    route = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_')[-80:]
+    return f"{datetime.utcnow():%Y%m%dT%H%M%S}_{request.method}_{route}_{uuid.uuid4().hex[:8]}"
+
+
+def _save_reports(profile_dir: str, name: str, title: str, profiler: cProfile.Profile,
+                  sampler: _StackSampler) -> None:
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, name)
+
+    profiler.dump_stats(f'{base}.pstats')
+
+    with open(f'{base}.collapsed', 'w', encoding='utf-8') as target:
+        for stack, count in sampler.samples.most_common():
+            target.write(f'{stack} {count}\n')
+
+    summary = io.StringIO()
+    summary.write(f"{title}\n\n")
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    with open(f'{base}.txt', 'w', encoding='utf-8') as target:
+        target.write(summary.getvalue())
+
+
+def init_profiler(app):
+    """
+    Profile individual requests on demand.
+
+    A request is profiled when it carries the PROFILER_TOKEN in an
+    X-Profile header or a ?profile= query argument. cProfile runs for the
+    whole request, including a streamed response body, and three files are
+    written to PROFILE_DIR:
+
+    - <name>.pstats     cProfile data (python -m pstats, snakeviz)
+    - <name>.collapsed  sampled stacks in collapsed format (flamegraph.pl, speedscope)
+    - <name>.txt        the top functions by cumulative time
+
+    The response carries the report name in an X-Profile-Id header. Without
+    a PROFILER_TOKEN no hooks are installed, so there is no overhead at all.
+    """
+    token = app.config.get('PROFILER_TOKEN')
+    if not token:
+        return
+    profile_dir = app.config['PROFILE_DIR']
+
+    @app.before_request
+    def start_profiling():
+        if not _profile_requested(token) or not _profile_lock.acquire(blocking=False):
+            return
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler (e.g. a debugger) is already active
+            _profile_lock.release()
+            logger.warning(f"Could not start request profiler: {e}")
+            return
+
+        sampler = _StackSampler(threading.get_ident(), SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+        g.profile = (profiler, sampler, time.perf_counter(), _report_name(), f"{request.method} {request.path}")
+
+    @app.after_request
+    def finish_profiling(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+
+        profiler, sampler, started, name, description = profile
+
+        def stop():
+            # Runs once the response body has been sent
+            try:
+                profiler.disable()
+                sampler.stop()
+                title = f"{description}  {response.status_code}  {(time.perf_counter() - started) * 1000:.1f} ms"
+                _save_reports(profile_dir, name, title, profiler, sampler)
+                logger.info(f"Request profile saved to {os.path.join(profile_dir, name)}.*")
+            except Exception as e:
+                logger.error(f"Error saving request profile {name}: {e}")
+            finally:
+                _profile_lock.release()
+
+        response.headers['X-Profile-Id'] = name
+        response.call_on_close(stop)
+        return response
@@ -1,19 +1,55 @@
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import time
+import unicodedata
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, send_file
+from urllib.parse import quote
+from flask import Response, request, jsonify, make_response, send_file, stream_with_context
+from werkzeug.http import dump_options_header
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from app import app
 from database import db
-from models import Journey, User
+from models import Journey, User, ExportJob
 from postcode_service import PostcodeService
+from export_jobs import enqueue_export
+from journey_resolver import mark_pending
+from history_geocoder import history_geocoder, reverse_geocode
+from idempotency import idempotent
+from journey_events import notifier, notify_journeys_changed, postgres_listener, stream_slots
+from postcode_index import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, autocomplete
+from journey_trail import TrailFormatError, append_fixes, encode_polyline, get_trail_points, parse_fixes, trail_distance
+from metrics import render_metrics
+from journey_export import FILTER_ARGS, ExportFilters, iter_csv, journey_summary, write_excel
+from journey_geo import (
+    MAX_NEAR_RADIUS_MILES, MAX_ZOOM, BoundingBox, cluster_journey_points, journeys_near, parse_map_kinds
+)
+from journey_import import (
+    ImportFormatError, MAX_IMPORT_ROWS, parse_import_file, parse_import_rows, validate_import_rows
+)
 
 logger = logging.getLogger(__name__)
 
 # Base path prefix for all API routes (matches Nginx alias)
 API_PREFIX = '/LocationApp/api'
 
+# Maximum number of IDs bound into a single bulk DELETE statement
+DELETE_CHUNK_SIZE = 1000
+
+# Number of journeys written per multi-row INSERT during bulk import
+IMPORT_CHUNK_SIZE = 1000
+
+# Maximum number of operations in one /batch request
+MAX_BATCH_OPERATIONS = 10
+
+# Default and maximum page sizes for the ops (debug) listings
+OPS_PAGE_SIZE = 100
+OPS_MAX_PAGE_SIZE = 500
+
 # JWT Token Management
 def create_token(user_id: int) -> str:
     """Create a JWT token for the user."""
@@ -65,6 +101,27 @@ def require_auth(f):
         return f(current_user, *args, **kwargs)
     return decorated_function
 
+def require_ops(f):
+    """Decorator for ops endpoints: authentication plus a username listed in OPS_USERNAMES."""
+    @wraps(f)
+    @require_auth
+    def decorated_function(current_user, *args, **kwargs):
+        if current_user.username not in app.config['OPS_USERNAMES']:
+            return jsonify({'success': False, 'message': 'Not permitted'}), 403
+        return f(current_user, *args, **kwargs)
+    return decorated_function
+
+def attachment_header(filename: str) -> str:
+    """Build a Content-Disposition header for a download, as send_file would (quoting and escaping included)."""
+    try:
+        filename.encode('ascii')
+        names = {'filename': filename}
+    except UnicodeEncodeError:
+        # An ASCII approximation for old clients, and the exact name for the rest
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+    return dump_options_header('attachment', names)
+
 # API Routes
 @app.route(f'{API_PREFIX}/health', methods=['GET'])
 def health_check():
@@ -75,11 +132,18 @@ def health_check():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics, aggregated across all gunicorn workers."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 @app.route(f'{API_PREFIX}/debug/user-count', methods=['GET'])
-def debug_user_count():
+@require_ops
+def debug_user_count(current_user):
     """Debug endpoint to check user count."""
     try:
-        user_count = User.query.count()
+        user_count = db.session.execute(db.select(db.func.count(User.id))).scalar()
         return jsonify({
             'success': True,
             'user_count': user_count,
@@ -92,22 +156,44 @@ def debug_user_count():
         }), 500
 
 @app.route(f'{API_PREFIX}/debug/active-journeys', methods=['GET'])
-def debug_active_journeys():
-    """Debug endpoint to check active journeys."""
+@require_ops
+def debug_active_journeys(current_user):
+    """List active journeys with their usernames, a page at a time (?page=1&per_page=100)."""
     try:
-        active_journeys = Journey.query.filter(Journey.end_time.is_(None)).all()
+        try:
+            page = max(int(request.args.get('page', 1)), 1)
+            per_page = min(max(int(request.args.get('per_page', OPS_PAGE_SIZE)), 1), OPS_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'page and per_page must be integers'}), 400
+        
+        count = db.session.execute(
+            db.select(db.func.count(Journey.id)).where(Journey.end_time.is_(None))
+        ).scalar()
+        
+        # One query for the page, with the username joined in rather than loaded per row
+        rows = db.session.execute(
+            db.select(Journey.id, Journey.user_id, User.username, Journey.start_postcode, Journey.start_time)
+            .outerjoin(User, User.id == Journey.user_id)
+            .where(Journey.end_time.is_(None))
+            .order_by(Journey.start_time, Journey.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        ).all()
+        
         return jsonify({
             'success': True,
             'active_journeys': [
                 {
-                    'id': j.id,
-                    'user_id': j.user_id,
-                    'username': j.user.username if j.user else 'Unknown',
-                    'start_postcode': j.start_postcode,
-                    'start_time': j.start_time.isoformat() if j.start_time else None
-                } for j in active_journeys
+                    'id': row.id,
+                    'user_id': row.user_id,
+                    'username': row.username or 'Unknown',
+                    'start_postcode': row.start_postcode,
+                    'start_time': row.start_time.isoformat() if row.start_time else None
+                } for row in rows
             ],
-            'count': len(active_journeys),
+            'count': count,
+            'page': page,
+            'per_page': per_page,
             'timestamp': datetime.utcnow().isoformat()
         })
     except Exception as e:
@@ -117,25 +203,43 @@ def debug_active_journeys():
         }), 500
 
 @app.route(f'{API_PREFIX}/debug/clear-active-journeys', methods=['POST'])
-def debug_clear_active_journeys():
-    """Debug endpoint to clear all active journeys."""
+@require_ops
+def debug_clear_active_journeys(current_user):
+    """
+    End active journeys in a single UPDATE, optionally only those older than
+    older_than_hours (JSON body or query string).
+    """
     try:
-        active_journeys = Journey.query.filter(Journey.end_time.is_(None)).all()
-        count = len(active_journeys)
-        
-        for journey in active_journeys:
-            # Mark as ended with current time
-            journey.end_time = datetime.utcnow()
-            journey.end_postcode = journey.start_postcode  # Use start postcode as end
-            journey.distance_miles = 0.0  # Zero distance for debug cleanup
+        data = request.get_json(silent=True) or {}
+        older_than_hours = data.get('older_than_hours', request.args.get('older_than_hours'))
         
+        now = datetime.utcnow()
+        query = db.update(Journey).where(Journey.end_time.is_(None))
+        if older_than_hours is not None:
+            try:
+                cutoff = now - timedelta(hours=float(older_than_hours))
+            except (TypeError, ValueError, OverflowError):
+                return jsonify({'success': False, 'message': 'older_than_hours must be a number of hours within range'}), 400
+            query = query.where(Journey.start_time < cutoff)
+        
+        # Mark as ended now, from the start postcode with zero distance
+        cleared_ids = db.session.execute(
+            query.values(end_time=now, end_postcode=Journey.start_postcode, distance_miles=0.0)
+            .returning(Journey.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if cleared_ids:
+            notify_journeys_changed(None)
         db.session.commit()
         
+        logger.info(f"User {current_user.username} cleared {len(cleared_ids)} active journeys")
+        
         return jsonify({
             'success': True,
-            'message': f'Cleared {count} active journeys',
-            'cleared_count': count,
-            'timestamp': datetime.utcnow().isoformat()
+            'message': f'Cleared {len(cleared_ids)} active journeys',
+            'cleared_count': len(cleared_ids),
+            'cleared_ids': cleared_ids,
+            'timestamp': now.isoformat()
         })
     except Exception as e:
         db.session.rollback()
@@ -268,6 +372,7 @@ def logout(current_user):
 
 @app.route(f'{API_PREFIX}/journey/start', methods=['POST'])
 @require_auth
+@idempotent
 def start_journey(current_user):
     """Start a new journey using GPS coordinates. Requires authentication."""
     try:
@@ -310,7 +415,8 @@ def start_journey(current_user):
         
         # Get postcode from coordinates - timeout is handled by PostcodeService
         try:
-            start_postcode = PostcodeService.get_postcode_from_coordinates(lat, lon)
+            # Falls back to a postcode from the user's own journeys if postcodes.io has none
+            start_postcode, start_approximate = reverse_geocode(current_user.id, lat, lon)
             
             if not start_postcode:
                 return jsonify({
@@ -336,6 +442,7 @@ def start_journey(current_user):
             start_postcode=start_postcode,
             start_latitude=lat,
             start_longitude=lon,
+            start_postcode_approximate=start_approximate,
             user_id=current_user.id,
             client_name=client_name,
             recharge_to_client=recharge_to_client,
@@ -359,6 +466,7 @@ def start_journey(current_user):
 
 @app.route(f'{API_PREFIX}/journey/end', methods=['POST'])
 @require_auth
+@idempotent
 def end_journey(current_user):
     """End the active journey. Requires authentication."""
     try:
@@ -386,9 +494,23 @@ def end_journey(current_user):
         if not journey:
             return jsonify({'success': False, 'message': 'No active journey found'}), 404
         
+        # "Prefer: respond-async" - store the end point now and let the
+        # journey resolver fill in the postcode and distance afterwards
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            mark_pending(journey, lat, lon)
+            db.session.commit()
+            
+            logger.info(f"Journey {journey.id} ended, postcode and distance deferred")
+            
+            return jsonify({
+                'success': True,
+                'message': 'Journey ended; postcode and distance will be resolved shortly',
+                'journey': journey.to_dict()
+            }), 202
+        
         # Get end postcode from coordinates - timeout is handled by PostcodeService
         try:
-            end_postcode = PostcodeService.get_postcode_from_coordinates(lat, lon)
+            end_postcode, end_approximate = reverse_geocode(current_user.id, lat, lon)
             
             if not end_postcode:
                 return jsonify({
@@ -409,14 +531,17 @@ def end_journey(current_user):
                 'message': f'Could not determine UK postcode for coordinates ({lat}, {lon}). This app only works within the UK. Please ensure you are in the UK and have a good GPS signal.'
             }), 400
         
-        # Calculate distance
-        distance = PostcodeService.calculate_distance(journey.start_postcode, end_postcode)
+        # Calculate distance - along the GPS trail if the app sent one, otherwise between postcodes
+        distance = trail_distance(journey, lat, lon)
+        if distance is None:
+            distance = PostcodeService.calculate_distance(journey.start_postcode, end_postcode)
         if distance is None:
             logger.warning(f"Could not calculate distance between {journey.start_postcode} and {end_postcode}")
             # Continue anyway - distance calculation failure shouldn't stop journey completion
         
         # Update journey
         journey.end_postcode = end_postcode
+        journey.end_postcode_approximate = end_approximate
         journey.end_latitude = lat
         journey.end_longitude = lon
         journey.end_time = datetime.utcnow()
@@ -437,8 +562,59 @@ def end_journey(current_user):
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to end journey'}), 500
 
+@app.route(f'{API_PREFIX}/journey/points', methods=['POST'])
+@require_auth
+def add_journey_points(current_user):
+    """
+    Add a batch of GPS fixes to the active journey's trail. Requires authentication.
+    
+    The app buffers fixes from its location manager and sends them here
+    every few seconds or so, and once more before /journey/end. Each batch
+    is stored as one compact row and the journey's trail mileage is kept up
+    to date, so ending the journey doesn't reprocess the trail.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+        
+        try:
+            fixes, malformed = parse_fixes(data)
+        except TrailFormatError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        # Lock the journey row so concurrent batches update the running totals one at a time
+        journey = db.session.execute(
+            db.select(Journey)
+            .where(Journey.user_id == current_user.id, Journey.end_time.is_(None))
+            .with_for_update()
+        ).scalars().first()
+        if not journey:
+            return jsonify({'success': False, 'message': 'No active journey found'}), 404
+        
+        result = append_fixes(journey, fixes)
+        db.session.commit()
+        
+        logger.info(f"Journey {journey.id}: {result['accepted']} trail point(s) added, "
+                    f"{result['dropped'] + malformed} dropped")
+        
+        return jsonify({
+            'success': True,
+            'message': f"Added {result['accepted']} point(s)",
+            'accepted': result['accepted'],
+            'dropped': result['dropped'] + malformed,
+            'trail_point_count': journey.trail_point_count,
+            'trail_distance_miles': round(journey.trail_distance_miles or 0.0, 2)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error adding trail points for user {current_user.username}: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to add journey points'}), 500
+
 @app.route(f'{API_PREFIX}/journey/manual', methods=['POST'])
 @require_auth
+@idempotent
 def create_manual_journey(current_user):
     """Create a manual journey using postcodes. Requires authentication."""
     try:
@@ -519,6 +695,81 @@ def create_manual_journey(current_user):
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Failed to create manual journey'}), 500
 
+@app.route(f'{API_PREFIX}/journeys/import', methods=['POST'])
+@require_auth
+def import_journeys(current_user):
+    """Bulk import completed journeys from a CSV or JSON file in the export layout."""
+    try:
+        upload = request.files.get('file')
+        try:
+            if upload:
+                rows = parse_import_file(upload.filename or '', upload.read())
+                first_row_number = 1 if (upload.filename or '').lower().endswith('.json') else 2
+            else:
+                data = request.get_json(silent=True)
+                if data is None:
+                    return jsonify({'success': False, 'message': 'No file or data provided'}), 400
+                rows = parse_import_rows(data)
+                first_row_number = 1
+        except ImportFormatError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        if not rows:
+            return jsonify({'success': False, 'message': 'No journeys to import'}), 400
+        
+        if len(rows) > MAX_IMPORT_ROWS:
+            return jsonify({
+                'success': False,
+                'message': f'Too many rows ({len(rows)}); the maximum per import is {MAX_IMPORT_ROWS}'
+            }), 400
+        
+        journeys, errors = validate_import_rows(rows, first_row_number)
+        warnings = []
+        
+        # Resolve every distinct postcode still needing a distance in one batched pass
+        pending = [journey for journey in journeys if journey['distance_miles'] is None]
+        if pending:
+            postcodes = {pc for journey in pending for pc in (journey['start_postcode'], journey['end_postcode'])}
+            postcode_info = PostcodeService.bulk_get_postcode_info(list(postcodes))
+            
+            for journey in pending:
+                info1 = postcode_info.get(journey['start_postcode'])
+                info2 = postcode_info.get(journey['end_postcode'])
+                if info1 and info2:
+                    journey['distance_miles'] = PostcodeService.calculate_distance_from_coordinates(
+                        info1.latitude, info1.longitude,
+                        info2.latitude, info2.longitude
+                    )
+                else:
+                    # Match manual journeys: store the journey without a distance
+                    warnings.append({'row': journey['row'], 'warning': 'Could not calculate distance'})
+        
+        # Multi-row INSERTs, one statement per chunk, all in a single transaction
+        for start in range(0, len(journeys), IMPORT_CHUNK_SIZE):
+            chunk = journeys[start:start + IMPORT_CHUNK_SIZE]
+            db.session.execute(db.insert(Journey), [
+                {key: value for key, value in journey.items() if key != 'row'} | {'user_id': current_user.id}
+                for journey in chunk
+            ])
+        
+        db.session.commit()
+        
+        logger.info(f"User {current_user.username} imported {len(journeys)} journey(s), {len(errors)} row(s) rejected")
+        
+        return jsonify({
+            'success': True,
+            'message': f'Imported {len(journeys)} journey(s)',
+            'imported_count': len(journeys),
+            'error_count': len(errors),
+            'errors': errors,
+            'warnings': warnings
+        }), 201
+    
+    except Exception as e:
+        logger.error(f"Error importing journeys for user {current_user.username}: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to import journeys'}), 500
+
 @app.route(f'{API_PREFIX}/journey/active', methods=['GET'])
 @require_auth
 def get_active_journey(current_user):
@@ -543,6 +794,87 @@ def get_active_journey(current_user):
         logger.error(f"Error getting active journey for user {current_user.username}: {e}")
         return jsonify({'success': False, 'message': 'Failed to get active journey'}), 500
 
+def _active_journey_event(user_id: int):
+    """The active journey as an SSE event, with an id that changes whenever the journey does."""
+    journey = db.session.execute(
+        db.select(Journey).where(Journey.user_id == user_id, Journey.end_time.is_(None))
+    ).scalars().first()
+    payload = json.dumps({
+        'active': journey is not None,
+        'journey': journey.to_dict() if journey else None
+    }, sort_keys=True)
+    event_id = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+    return event_id, f'id: {event_id}\nevent: active_journey\ndata: {payload}\n\n'
+
+@app.route(f'{API_PREFIX}/journey/active/stream', methods=['GET'])
+@require_auth
+def stream_active_journey(current_user):
+    """
+    Server-Sent Events stream of the authenticated user's active journey.
+    
+    Sends an active_journey event (the /journey/active body, without
+    'success') when the stream opens and then only when the active journey
+    changes: started, ended, deleted or updated, from any device or worker.
+    A comment line is sent every JOURNEY_STREAM_HEARTBEAT seconds to keep
+    proxies from closing the connection, and the stream ends after
+    JOURNEY_STREAM_MAX_SECONDS so the client reconnects with a fresh token
+    check. Reconnecting with Last-Event-ID skips the first event if nothing
+    has changed since.
+    
+    The database connection is only held while the journey is read, so an
+    idle stream costs a socket and (with gevent workers) a greenlet.
+    """
+    postgres_listener.ensure_started(app)
+    user_id = current_user.id
+    username = current_user.username
+    last_event_id = request.headers.get('Last-Event-ID')
+    heartbeat = app.config['JOURNEY_STREAM_HEARTBEAT']
+    max_seconds = app.config['JOURNEY_STREAM_MAX_SECONDS']
+    
+    # The slot is given back when the server closes the response (see call_on_close below)
+    if not stream_slots.acquire(app.config['JOURNEY_STREAM_MAX_CONNECTIONS']):
+        response = jsonify({
+            'success': False,
+            'message': 'Too many open streams, poll /journey/active instead'
+        })
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    def generate():
+        sent_event_id = last_event_id
+        deadline = time.monotonic() + max_seconds
+        with notifier.subscribe(user_id) as subscription:
+            yield 'retry: 5000\n\n'
+            while True:
+                version = subscription.version
+                try:
+                    event_id, event = _active_journey_event(user_id)
+                finally:
+                    # Give the connection back to the pool while the stream is idle
+                    db.session.close()
+                if event_id != sent_event_id:
+                    sent_event_id = event_id
+                    yield event
+                
+                while not subscription.wait(version, min(heartbeat, max(deadline - time.monotonic(), 0))):
+                    if time.monotonic() >= deadline:
+                        logger.info(f"Closing active journey stream for user {username} after {max_seconds}s")
+                        return
+                    yield ': keepalive\n\n'
+    
+    try:
+        response = Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception:
+        stream_slots.release()
+        raise
+    # Runs once the server is done with the response, whether or not the stream ever started
+    response.call_on_close(stream_slots.release)
+    return response
+
 @app.route(f'{API_PREFIX}/journeys', methods=['GET'])
 @require_auth
 def get_journeys(current_user):
@@ -561,6 +893,120 @@ def get_journeys(current_user):
         logger.error(f"Error getting journeys for user {current_user.username}: {e}")
         return jsonify({'success': False, 'message': 'Failed to get journeys'}), 500
 
+@app.route(f'{API_PREFIX}/journeys/map', methods=['GET'])
+@require_auth
+def get_journey_map(current_user):
+    """
+    Get clustered journey start/end points for a map viewport.
+    
+    Takes bbox (min_lon,min_lat,max_lon,max_lat), zoom (0-22), optionally kind
+    (start, end or both) and the export filters. The payload grows with the
+    viewport, not with the user's journey history.
+    """
+    try:
+        try:
+            bbox = BoundingBox.from_arg(request.args.get('bbox', ''))
+            kinds = parse_map_kinds(request.args.get('kind'))
+            filters = ExportFilters.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        zoom = request.args.get('zoom', type=int)
+        if zoom is None or not 0 <= zoom <= MAX_ZOOM:
+            return jsonify({'success': False, 'message': f'zoom must be an integer between 0 and {MAX_ZOOM}'}), 400
+        
+        clusters, cell_degrees = cluster_journey_points(current_user.id, bbox, zoom, kinds, filters)
+        
+        return jsonify({
+            'success': True,
+            'zoom': zoom,
+            'cell_degrees': cell_degrees,
+            'clusters': clusters
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting journey map for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to get journey map'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/near', methods=['GET'])
+@require_auth
+def get_journeys_near(current_user):
+    """
+    Get journeys that started or ended within radius_miles of lat/lon, nearest first.
+    
+    Optionally takes kind (start, end or both) and the export filters, e.g.
+    client_name and recharge_to_client for a rechargeable audit of one site.
+    """
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_miles = request.args.get('radius_miles', 0.5, type=float)
+        
+        if lat is None or lon is None or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            return jsonify({'success': False, 'message': 'Valid lat and lon are required'}), 400
+        if not 0 < radius_miles <= MAX_NEAR_RADIUS_MILES:
+            return jsonify({'success': False, 'message': f'radius_miles must be between 0 and {MAX_NEAR_RADIUS_MILES:g}'}), 400
+        
+        try:
+            kinds = parse_map_kinds(request.args.get('kind'))
+            filters = ExportFilters.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        journeys = journeys_near(current_user.id, lat, lon, radius_miles, kinds, filters)
+        
+        logger.info(f"Found {len(journeys)} journeys within {radius_miles} miles of ({lat}, {lon}) for user {current_user.username}")
+        
+        return jsonify({
+            'success': True,
+            'journeys': journeys
+        })
+        
+    except Exception as e:
+        logger.error(f"Error finding nearby journeys for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to find nearby journeys'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/<int:journey_id>', methods=['GET'])
+@require_auth
+def get_journey(current_user, journey_id):
+    """Get a single journey, e.g. to poll a deferred completion until it is resolved."""
+    try:
+        journey = Journey.query.filter_by(id=journey_id, user_id=current_user.id).first()
+        if not journey:
+            return jsonify({'success': False, 'message': 'Journey not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'journey': journey.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting journey {journey_id} for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to get journey'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/<int:journey_id>/trail', methods=['GET'])
+@require_auth
+def get_journey_trail(current_user, journey_id):
+    """Get a journey's GPS trail as a single encoded polyline (5 decimal places)."""
+    try:
+        journey = Journey.query.filter_by(id=journey_id, user_id=current_user.id).first()
+        if not journey:
+            return jsonify({'success': False, 'message': 'Journey not found'}), 404
+        
+        points = get_trail_points(journey.id)
+        
+        return jsonify({
+            'success': True,
+            'journey_id': journey.id,
+            'point_count': len(points),
+            'distance_miles': round(journey.trail_distance_miles, 2) if journey.trail_distance_miles is not None else None,
+            'polyline': encode_polyline(points)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting trail for journey {journey_id} for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to get journey trail'}), 500
+
 @app.route(f'{API_PREFIX}/postcodes', methods=['GET'])
 def get_postcodes():
     """Legacy endpoint for postcodes - returns empty list since we removed postcode management."""
@@ -605,6 +1051,24 @@ def get_postcode_from_coordinates():
         logger.error(f"Error getting postcode from coordinates: {e}")
         return jsonify({'success': False, 'message': 'Failed to get postcode'}), 500
 
+@app.route(f'{API_PREFIX}/postcode/autocomplete', methods=['GET'])
+@require_auth
+def autocomplete_postcode(current_user):
+    """Suggest postcodes for a partly typed one (q), the user's own most used first. No upstream calls."""
+    try:
+        query = request.args.get('q', '')
+        limit = min(max(request.args.get('limit', DEFAULT_SUGGESTIONS, type=int), 1), MAX_SUGGESTIONS)
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'suggestions': autocomplete(current_user.id, query, limit)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error autocompleting postcode '{request.args.get('q')}' for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to autocomplete postcode'}), 500
+
 @app.route(f'{API_PREFIX}/journeys/delete', methods=['POST'])
 @require_auth
 def delete_journeys(current_user):
@@ -618,22 +1082,48 @@ def delete_journeys(current_user):
         if not journey_ids or not isinstance(journey_ids, list):
             return jsonify({'success': False, 'message': 'Journey IDs are required'}), 400
         
-        # Find and delete journeys belonging to this user
-        deleted_count = 0
+        # Normalise IDs; anything that isn't an integer can never match a row
+        requested_ids = []
+        invalid_ids = []
         for journey_id in journey_ids:
-            journey = Journey.query.filter_by(id=journey_id, user_id=current_user.id).first()
-            if journey:
-                db.session.delete(journey)
-                deleted_count += 1
-        
+            try:
+                requested_ids.append(int(journey_id))
+            except (ValueError, TypeError):
+                invalid_ids.append(journey_id)
+        requested_ids = list(dict.fromkeys(requested_ids))
+        
+        # One set-based DELETE per chunk instead of a SELECT + DELETE per ID
+        deleted_ids = []
+        for start in range(0, len(requested_ids), DELETE_CHUNK_SIZE):
+            chunk = requested_ids[start:start + DELETE_CHUNK_SIZE]
+            result = db.session.execute(
+                db.delete(Journey)
+                .where(Journey.user_id == current_user.id, Journey.id.in_(chunk))
+                .returning(Journey.id)
+                .execution_options(synchronize_session=False)
+            )
+            deleted_ids.extend(row[0] for row in result)
+        
+        if deleted_ids:
+            notify_journeys_changed(current_user.id)
         db.session.commit()
+        if deleted_ids:
+            # Deleted journeys must not keep supplying fallback postcodes
+            history_geocoder.invalidate(current_user.id)
+        
+        deleted_set = set(deleted_ids)
+        deleted_ids = [journey_id for journey_id in requested_ids if journey_id in deleted_set]
+        not_found_ids = [journey_id for journey_id in requested_ids if journey_id not in deleted_set] + invalid_ids
+        deleted_count = len(deleted_ids)
         
         logger.info(f"User {current_user.username} deleted {deleted_count} journey(s)")
         
         return jsonify({
             'success': True,
             'message': f'Successfully deleted {deleted_count} journey(s)',
-            'deleted_count': deleted_count
+            'deleted_count': deleted_count,
+            'deleted_ids': deleted_ids,
+            'not_found_ids': not_found_ids
         })
         
     except Exception as e:
@@ -644,57 +1134,19 @@ def delete_journeys(current_user):
 @app.route(f'{API_PREFIX}/journeys/export/csv', methods=['GET'])
 @require_auth
 def export_journeys_csv(current_user):
-    """Export completed journeys for the current user as a CSV file."""
+    """Export journeys for the current user as a streamed CSV file, optionally filtered."""
     try:
-        import csv
-        from io import StringIO, BytesIO
-        
-        # Fetch journeys for user (include both completed and active journeys)
-        journeys = Journey.query.filter_by(user_id=current_user.id).order_by(Journey.start_time.desc()).all()
-        
-        # Prepare CSV in memory
-        csv_buffer = StringIO()
-        writer = csv.writer(csv_buffer)
-        
-        # Header - new requested format
-        writer.writerow([
-            'Date', 'Postcode From', 'Postcode To', 'Client Name', 'Recharge to Client', 'Description', 'Total Miles'
-        ])
-        
-        # Data rows
-        for j in journeys:
-            # Extract date component only (no time)
-            start_date = ''
-            
-            try:
-                if j.start_time:
-                    start_date = j.start_time.strftime('%Y-%m-%d')
-            except Exception as e:
-                logger.warning(f"Error formatting date for journey {j.id}: {e}")
-            
-            # Handle Yes/No for recharge field
-            recharge_text = 'Yes' if j.recharge_to_client else 'No' if j.recharge_to_client is not None else ''
-            
-            writer.writerow([
-                start_date,                                          # Date (without time)
-                j.start_postcode,                                   # Postcode From (Start Postcode)
-                j.end_postcode or '',                               # Postcode To (End Postcode)
-                j.client_name or '',                                # Client Name
-                recharge_text,                                      # Recharge to Client (Yes/No)
-                j.description or '',                                # Description
-                f"{j.distance_miles:.2f}" if j.distance_miles else ''  # Total Miles
-            ])
-        
-        # Convert to bytes
-        csv_bytes = BytesIO(csv_buffer.getvalue().encode('utf-8'))
-        
-        # Build response
-        csv_bytes.seek(0)
-        return send_file(
-            csv_bytes,
+        try:
+            filters = ExportFilters.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        # Rows are written as they are read from a server-side cursor, so the
+        # full export is never held in memory
+        return Response(
+            stream_with_context(iter_csv(current_user.id, filters)),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'journeys_{current_user.username}.csv'
+            headers={'Content-Disposition': attachment_header(f'journeys_{current_user.username}.csv')}
         )
     except Exception as e:
         logger.error(f"CSV export failed for user {current_user.username}: {e}")
@@ -703,80 +1155,22 @@ def export_journeys_csv(current_user):
 @app.route(f'{API_PREFIX}/journeys/export/excel', methods=['GET'])
 @require_auth
 def export_journeys_excel(current_user):
-    """Export completed journeys for the current user as an Excel (.xlsx) file."""
+    """Export journeys for the current user as an Excel (.xlsx) file, optionally filtered."""
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill
-        from io import BytesIO
+        try:
+            filters = ExportFilters.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        # Fetch journeys for user (include both completed and active journeys)
-        journeys = Journey.query.filter_by(user_id=current_user.id).order_by(Journey.start_time.desc()).all()
-        
-        # Create workbook and select active sheet
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "Journeys"
-        
-        # Header row with formatting
-        headers = [
-            'Date', 'Postcode From', 'Postcode To', 'Client Name', 'Recharge to Client', 'Description', 'Total Miles'
-        ]
-        
-        # Add headers to first row
-        for col, header in enumerate(headers, 1):
-            cell = sheet.cell(row=1, column=col, value=header)
-            # Blue background with white text
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
-        
-        # Data rows
-        for row_idx, journey in enumerate(journeys, 2):  # Start from row 2
-            # Extract date component only (no time)
-            start_date = ''
-            try:
-                if journey.start_time:
-                    start_date = journey.start_time.strftime('%Y-%m-%d')
-            except Exception as e:
-                logger.warning(f"Error formatting date for journey {journey.id}: {e}")
-            
-            # Handle Yes/No for recharge field
-            recharge_text = 'Yes' if journey.recharge_to_client else 'No' if journey.recharge_to_client is not None else ''
-            
-            # Fill row data
-            row_data = [
-                start_date,                                                    # Date (without time)
-                journey.start_postcode,                                       # Postcode From (Start Postcode)
-                journey.end_postcode or '',                                   # Postcode To (End Postcode) 
-                journey.client_name or '',                                    # Client Name
-                recharge_text,                                                # Recharge to Client (Yes/No)
-                journey.description or '',                                    # Description
-                float(journey.distance_miles) if journey.distance_miles else ''  # Total Miles
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                sheet.cell(row=row_idx, column=col, value=value)
-        
-        # Auto-adjust column widths for better appearance
-        for column in sheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)  # Cap at 50 characters
-            sheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save to BytesIO buffer
-        excel_buffer = BytesIO()
-        workbook.save(excel_buffer)
-        excel_buffer.seek(0)
+        # Build the workbook in a temporary file rather than in memory;
+        # send_file streams it back and it is removed once closed
+        excel_file = tempfile.TemporaryFile()
+        write_excel(current_user.id, excel_file, filters)
+        excel_file.seek(0)
         
         # Build response
         return send_file(
-            excel_buffer,
+            excel_file,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=f'journeys_{current_user.username}.xlsx'
@@ -786,6 +1180,207 @@ def export_journeys_excel(current_user):
         logger.error(f"Excel export failed for user {current_user.username}: {e}")
         return jsonify({'success': False, 'message': 'Failed to export Excel file'}), 500
 
+@app.route(f'{API_PREFIX}/journeys/export/jobs', methods=['POST'])
+@require_auth
+def create_export_job(current_user):
+    """Queue a background export; poll the returned job and download it when completed."""
+    try:
+        data = request.get_json(silent=True) or {}
+        export_format = (data.get('format') or 'xlsx').strip().lower()
+        if export_format == 'excel':
+            export_format = 'xlsx'
+        
+        try:
+            job = enqueue_export(current_user.id, export_format, data)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': 'Export queued',
+            'job': job.to_dict()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error queueing export for user {current_user.username}: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to queue export'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/export/jobs/<int:job_id>', methods=['GET'])
+@require_auth
+def get_export_job(current_user, job_id):
+    """Get the status and progress of one of the user's export jobs."""
+    try:
+        job = ExportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        if not job:
+            return jsonify({'success': False, 'message': 'Export job not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting export job {job_id} for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to get export job'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/export/jobs/<int:job_id>/download', methods=['GET'])
+@require_auth
+def download_export_job(current_user, job_id):
+    """Download the file produced by a completed export job."""
+    try:
+        job = ExportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        if not job:
+            return jsonify({'success': False, 'message': 'Export job not found'}), 404
+        
+        if job.status == 'expired' or (job.expires_at and job.expires_at < datetime.utcnow()):
+            return jsonify({'success': False, 'message': 'Export has expired'}), 410
+        
+        if job.status != 'completed' or not job.file_path or not os.path.exists(job.file_path):
+            return jsonify({
+                'success': False,
+                'message': f'Export is not ready (status: {job.status})'
+            }), 409
+        
+        mimetype = 'text/csv' if job.format == 'csv' else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return send_file(
+            job.file_path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f'journeys_{current_user.username}.{job.format}'
+        )
+        
+    except Exception as e:
+        logger.error(f"Error downloading export job {job_id} for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to download export'}), 500
+
+def journey_summary_response(current_user, filter_args):
+    """
+    Miles and trips per client per month, as the /journeys/summary response.
+    
+    Args:
+        current_user: Owner of the journeys
+        filter_args: Export filter arguments (see ExportFilters.from_args)
+    """
+    try:
+        try:
+            filters = ExportFilters.from_args(filter_args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        summary = journey_summary(current_user.id, filters)
+        
+        return jsonify({
+            'success': True,
+            'summary': summary,
+            'totals': {
+                'trips': sum(entry['trips'] for entry in summary),
+                'total_miles': round(sum(entry['total_miles'] for entry in summary), 2),
+                'recharge_miles': round(sum(entry['recharge_miles'] for entry in summary), 2)
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting journey summary for user {current_user.username}: {e}")
+        return jsonify({'success': False, 'message': 'Failed to get journey summary'}), 500
+
+@app.route(f'{API_PREFIX}/journeys/summary', methods=['GET'])
+@require_auth
+def get_journey_summary(current_user):
+    """Get miles and trips per client per month, using the export filters."""
+    return journey_summary_response(current_user, request.args)
+
+# Read operations available to /batch: name -> (handler, required integer
+# arguments, optional filter arguments). Handlers are the endpoints' views
+# without @require_auth, or helpers that take their arguments explicitly,
+# since the batch request's own query string is not theirs to read.
+BATCH_OPERATIONS = {
+    'profile': (get_profile.__wrapped__, (), ()),
+    'active_journey': (get_active_journey.__wrapped__, (), ()),
+    'journeys': (get_journeys.__wrapped__, (), ()),
+    'journey': (get_journey.__wrapped__, ('journey_id',), ()),
+    'summary': (journey_summary_response, (), FILTER_ARGS),
+    'export_job': (get_export_job.__wrapped__, ('job_id',), ()),
+}
+
+@app.route(f'{API_PREFIX}/batch', methods=['POST'])
+@require_auth
+def batch(current_user):
+    """
+    Run several read operations in one request, e.g. on app launch.
+    
+    Takes {"operations": [...]}, where each operation is a name from
+    BATCH_OPERATIONS or {"op": name, "id": result key, "args": {...}}, e.g.
+    {"op": "summary", "args": {"from": "2024-04-01"}}. The token is checked
+    and the user loaded once, and every operation shares the request's
+    database session. Each result carries the status code and body the
+    operation's own endpoint would have returned.
+    """
+    try:
+        if request.args:
+            return jsonify({
+                'success': False,
+                'message': 'Pass arguments per operation in the body, not in the query string'
+            }), 400
+        
+        data = request.get_json(silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not operations or not isinstance(operations, list):
+            return jsonify({'success': False, 'message': 'An operations list is required'}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({
+                'success': False,
+                'message': f'Too many operations ({len(operations)}); the maximum per batch is {MAX_BATCH_OPERATIONS}'
+            }), 400
+        
+        # Validate everything before running anything
+        planned = []
+        for operation in operations:
+            if isinstance(operation, str):
+                operation = {'op': operation}
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                return jsonify({
+                    'success': False,
+                    'message': f"Unknown operation; available: {', '.join(BATCH_OPERATIONS)}"
+                }), 400
+            
+            handler, id_args, filter_args = BATCH_OPERATIONS[operation['op']]
+            args = operation.get('args') or {}
+            if not isinstance(args, dict) or not set(id_args) <= set(args) <= set(id_args + filter_args):
+                expected = ', '.join(id_args + tuple(f'{name} (optional)' for name in filter_args)) or 'none'
+                return jsonify({'success': False, 'message': f"Operation '{operation['op']}' takes arguments: {expected}"}), 400
+            try:
+                handler_args = [int(args[name]) for name in id_args]
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': f"Arguments of '{operation['op']}' must be integers"}), 400
+            if filter_args:
+                filters = {name: args[name] for name in filter_args if name in args}
+                if not all(isinstance(value, str) for value in filters.values()):
+                    return jsonify({'success': False, 'message': f"Filters of '{operation['op']}' must be strings"}), 400
+                handler_args.append(filters)
+            
+            result_id = str(operation.get('id') or operation['op'])
+            if any(result_id == existing[0] for existing in planned):
+                return jsonify({'success': False, 'message': f"Duplicate operation id '{result_id}'"}), 400
+            planned.append((result_id, handler, handler_args))
+        
+        results = {}
+        for result_id, handler, handler_args in planned:
+            response = make_response(handler(current_user, *handler_args))
+            results[result_id] = {'status': response.status_code, 'body': response.get_json()}
+            if response.status_code >= 500:
+                db.session.rollback()
+        
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+        
+    except Exception as e:
+        logger.error(f"Error running batch for user {current_user.username}: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Failed to run batch'}), 500
+
 # --- JSON error handlers for unknown routes and methods ---
 @app.errorhandler(404)
 def handle_404(e):
@@ -0,0 +1,47 @@
+import logging
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from database import db
+from models import SchemaVersion
+from migrate import LATEST_VERSION
+
+logger = logging.getLogger(__name__)
+
+# A database created from the models is at the latest migration (see migrate.py)
+SCHEMA_VERSION = LATEST_VERSION
+SCHEMA_DESCRIPTION = 'Created from models'
+
+
+def get_schema_version():
+    """Current database schema version, or None if it has never been recorded."""
+    try:
+        return db.session.execute(db.select(db.func.max(SchemaVersion.version))).scalar()
+    except (OperationalError, ProgrammingError):
+        # schema_version table doesn't exist yet
+        db.session.rollback()
+        return None
+
+
+def ensure_schema() -> None:
+    """
+    Make sure the database schema is current, at the cost of one query when it is.
+
+    A new database is created from the models and recorded at SCHEMA_VERSION.
+    An existing database that is behind only gets its missing tables; column
+    and index changes are left to migrate.py, which applies them without
+    long table locks.
+    """
+    current = get_schema_version()
+    if current is not None and current >= SCHEMA_VERSION:
+        logger.info(f"Database schema is at version {current}")
+        return
+
+    is_new = not db.inspect(db.engine).has_table('journeys')
+    db.create_all()
+
+    if is_new:
+        db.session.add(SchemaVersion(version=SCHEMA_VERSION, description=SCHEMA_DESCRIPTION))
+        db.session.commit()
+        logger.info(f"Database schema created at version {SCHEMA_VERSION}")
+    else:
+        logger.warning(f"Database schema is at version {current or 0}, expected {SCHEMA_VERSION}: "
+                       f"run 'python migrate.py'")
@@ -0,0 +1,107 @@
+import math
+from typing import List, Optional, Tuple
+
+# Geohash alphabet (base 32 without a, i, l, o)
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Characters stored per position: a cell of about 5 x 5 metres
+GEOHASH_PRECISION = 9
+
+MILES_PER_DEGREE_LATITUDE = 69.05
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Encode a position as a geohash.
+
+    Nearby positions share a prefix, and every prefix is itself a cell
+    containing all the longer hashes that start with it, so a B-tree index on
+    the hash can answer "in this cell" with a range scan.
+    """
+    lat_low, lat_high = -90.0, 90.0
+    lon_low, lon_high = -180.0, 180.0
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (lon_low + lon_high) / 2
+            if longitude >= middle:
+                value = value << 1 | 1
+                lon_low = middle
+            else:
+                value <<= 1
+                lon_high = middle
+        else:
+            middle = (lat_low + lat_high) / 2
+            if latitude >= middle:
+                value = value << 1 | 1
+                lat_low = middle
+            else:
+                value <<= 1
+                lat_high = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def geohash_cell_degrees(precision: int) -> Tuple[float, float]:
+    """Height and width in degrees of a geohash cell with this many characters."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_prefix_end(prefix: str) -> Optional[str]:
+    """
+    The smallest hash greater than every hash starting with prefix, or None.
+
+    Hashes starting with prefix are exactly those >= prefix and < this value,
+    which keeps the comparison to alphanumerics that sort the same way in
+    every database collation.
+    """
+    chars = list(prefix)
+    while chars:
+        position = GEOHASH_ALPHABET.index(chars[-1])
+        if position + 1 < len(GEOHASH_ALPHABET):
+            chars[-1] = GEOHASH_ALPHABET[position + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def geohash_cover(latitude: float, longitude: float, radius_miles: float) -> List[str]:
+    """
+    Geohash prefixes whose cells together contain the circle around a point.
+
+    The longest prefix whose cells are at least radius_miles in each
+    direction is chosen; the cell containing the point and its eight
+    neighbours then cover the circle, whatever part of the cell the point
+    is in. Returns up to nine distinct prefixes.
+    """
+    # Cells are narrowest in miles at the edge of the circle furthest from the equator
+    edge_latitude = min(abs(latitude) + radius_miles / MILES_PER_DEGREE_LATITUDE, 89.9)
+    miles_per_degree_longitude = MILES_PER_DEGREE_LATITUDE * math.cos(math.radians(edge_latitude))
+
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_degrees(candidate)
+        if height * MILES_PER_DEGREE_LATITUDE >= radius_miles and width * miles_per_degree_longitude >= radius_miles:
+            precision = candidate
+            break
+
+    height, width = geohash_cell_degrees(precision)
+    prefixes = []
+    for lat_step in (-1, 0, 1):
+        cell_latitude = latitude + lat_step * height
+        if not -90 <= cell_latitude <= 90:
+            continue
+        for lon_step in (-1, 0, 1):
+            cell_longitude = (longitude + lon_step * width + 180) % 360 - 180
+            prefix = encode_geohash(cell_latitude, cell_longitude, precision)
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+    return prefixes